@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark frame analysis (stage 2) request concurrency against a local mock LLM server.
+
+Starts an Ollama-compatible /api/generate server on localhost that answers every request after
+a fixed latency and serves at most --server-slots requests at once, like a vLLM or Ollama
+backend with that many parallel slots. VideoAnalyzer then analyzes the same synthetic frames at
+each concurrency level and one JSON document with the timings is written. Needs neither
+network nor GPU.
+
+    PYTHONPATH=. python benchmarks/bench_analysis.py --frames 32 --latency 0.5 --concurrency 1,4,16
+
+Each result reports:
+    seconds           Wall time of analyze_frames
+    frames_per_second Frames analyzed per second
+    speedup           Wall time at concurrency 1 divided by this wall time
+    errors            Frames whose request failed
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from video_analyzer.analyzer import VideoAnalyzer
+from video_analyzer.clients.ollama import OllamaClient
+from video_analyzer.frame import Frame
+from video_analyzer.prompt import PromptLoader
+
+DEFAULT_CONFIG = Path(__file__).parent.parent / "video_analyzer" / "config" / "default_config.json"
+
+def start_mock_server(latency: float, slots: int) -> ThreadingHTTPServer:
+    """Serve /api/generate on a free localhost port from a background thread."""
+    available = threading.Semaphore(slots)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with available:
+                time.sleep(latency)
+            # One "Frame N:" section per frame the prompt mentions, so contact sheets split cleanly
+            count = request.get("prompt", "").count("captured at")
+            response = "\n".join(f"Frame {i + 1}: described" for i in range(count))
+            body = json.dumps({"model": request.get("model"), "response": response, "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def synthetic_frames(count: int, width: int, height: int) -> List[Frame]:
+    """In-memory JPEG frames with different content, one every two seconds."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        image = rng.integers(0, 255, size=(height // 8, width // 8, 3), dtype=np.uint8)
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_NEAREST)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        frames.append(Frame(i, None, i * 2.0, 0.0, image=encoded.tobytes()))
+    return frames
+
+def run_case(url: str, frames: List[Frame], concurrency: int, contact_sheet: int) -> Dict[str, Any]:
+    prompts = json.loads(DEFAULT_CONFIG.read_text())["prompts"]
+    analyzer = VideoAnalyzer(OllamaClient(url), "benchmark", PromptLoader("", prompts), 0.0,
+                             contact_sheet=contact_sheet, concurrency=concurrency)
+    start = time.perf_counter()
+    analyses = list(analyzer.analyze_frames(frames))
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "frames_per_second": round(len(frames) / elapsed, 2),
+        "requests": analyzer.stats["frame_requests"],
+        "errors": sum(a["response"].startswith("Error analyzing frame") for a in analyses)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame analysis concurrency against a mock LLM server")
+    parser.add_argument("--frames", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds the mock server takes per request")
+    parser.add_argument("--server-slots", type=int, default=16, help="Requests the mock server serves at once")
+    parser.add_argument("--concurrency", type=str, default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--contact-sheet", type=int, default=0, help="Frames per contact sheet (0 sends frames on their own)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--output", type=str, help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    levels = sorted({int(level) for level in args.concurrency.split(",")})
+    frames = synthetic_frames(args.frames, args.width, args.height)
+    server = start_mock_server(args.latency, args.server_slots)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    try:
+        for concurrency in levels:
+            result = {"concurrency": concurrency, **run_case(url, frames, concurrency, args.contact_sheet)}
+            results.append(result)
+            print(f"concurrency {concurrency:>3} {result['seconds']:>8.2f}s {result['frames_per_second']:>8.2f} frames/s", file=sys.stderr)
+    finally:
+        server.shutdown()
+    if results[0]["concurrency"] == 1:
+        for result in results:
+            result["speedup"] = round(results[0]["seconds"] / result["seconds"], 2)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "platform": platform.platform()
+        },
+        "parameters": {
+            "frames": args.frames,
+            "latency": args.latency,
+            "server_slots": args.server_slots,
+            "contact_sheet": args.contact_sheet,
+            "frame_size": f"{args.width}x{args.height}"
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
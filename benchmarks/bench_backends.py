@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Compare keyframe extraction time of the OpenCV and ffmpeg frame backends.
+
+Generates a synthetic scene from synthetic.py (or uses the video given with --video), runs
+VideoProcessor.extract_keyframes once per backend and prints the timings as JSON.
+
+    PYTHONPATH=. python benchmarks/bench_backends.py --width 1920 --height 1080 --seconds 60
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import SCENES, write_video
+from video_analyzer.ffmpeg_reader import has_ffmpeg
+from video_analyzer.frame import VideoProcessor
+
+def run(video: Path, backend: str, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as output_dir:
+        processor = VideoProcessor(video, Path(output_dir), "benchmark", backend=backend,
+                                   score_width=args.score_width, max_edge=args.max_edge)
+        start = time.perf_counter()
+        frames = processor.extract_keyframes(frames_per_minute=args.frames_per_minute)
+        elapsed = time.perf_counter() - start
+    return {"backend": backend, "seconds": round(elapsed, 3), "frames_selected": len(frames)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame extraction backends")
+    parser.add_argument("--video", type=str, help="Video to benchmark (default: generate one)")
+    parser.add_argument("--scene", type=str, default="cuts", choices=list(SCENES), help="Scene of the generated video")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--frames-per-minute", type=int, default=60)
+    parser.add_argument("--score-width", type=int, default=160)
+    parser.add_argument("--max-edge", type=int, default=None)
+    args = parser.parse_args()
+
+    backends = ["opencv"] + (["ffmpeg"] if has_ffmpeg() else [])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = Path(args.video) if args.video else write_video(
+            Path(temp_dir) / "synthetic.mp4", args.scene, args.width, args.height, args.seconds)
+        results = [run(video, backend, args) for backend in backends]
+    print(json.dumps({"video": args.video or f"synthetic {args.scene} {args.width}x{args.height} {args.seconds}s",
+                      "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Benchmark keyframe extraction (stage 1) on synthetic videos.
+
+Generates each scene at each size with cv2.VideoWriter, runs VideoProcessor.extract_keyframes
+once per settings preset and writes one JSON document with the timings, so results can be
+compared run to run. Every run happens in a fresh process so its peak RSS is its own. Needs
+neither network nor GPU.
+
+    PYTHONPATH=. python benchmarks/bench_extraction.py --scenes static,cuts --sizes 720p,1080p --output results.json
+
+Each result reports:
+    seconds           Wall time of extract_keyframes
+    video_fps         Source frames processed per second (total_frames / seconds)
+    sampled_fps       Sampled frames decoded and scored per second
+    frames_selected   Number of keyframes selected
+    peak_rss_mb       Peak resident memory of the run, including segment worker processes
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import cv2
+
+from synthetic import SCENES, SIZES, write_video
+from video_analyzer.ffmpeg_reader import has_ffmpeg
+from video_analyzer.frame import VideoProcessor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# VideoProcessor keyword arguments of each settings preset
+SETTINGS: Dict[str, Dict[str, Any]] = {
+    "opencv": {},
+    "opencv-inline": {"decode_ahead": 0},
+    "opencv-seek": {"decode_mode": "seek"},
+    "opencv-workers4": {"workers": 4},
+    "ffmpeg": {"backend": "ffmpeg"},
+    "keyframes": {"candidate_source": "keyframes"},
+    "ssim": {"metric": "ssim"},
+}
+NEEDS_FFMPEG = {"ffmpeg", "keyframes"}
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * unit / (1024 * 1024), 1)
+
+def run_case(video: str, settings: Dict[str, Any], frames_per_minute: int, score_width: int) -> Dict[str, Any]:
+    """Run one extraction. Called in a fresh process."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        processor = VideoProcessor(Path(video), Path(output_dir), "benchmark", score_width=score_width,
+                                   write_frames=False, **settings)
+        start = time.perf_counter()
+        frames = processor.extract_keyframes(frames_per_minute=frames_per_minute)
+        elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "video_fps": round(processor.total_frames / elapsed, 1),
+        "sampled_fps": round(processor.stats.get("sampled_frames", 0) / elapsed, 1),
+        "frames_selected": len(frames),
+        "peak_rss_mb": _peak_rss_mb(),
+        "stats": {key: value for key, value in processor.stats.items() if isinstance(value, (int, float))}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyframe extraction on synthetic videos")
+    parser.add_argument("--scenes", type=str, default=",".join(SCENES), help=f"Comma-separated scenes ({', '.join(SCENES)})")
+    parser.add_argument("--sizes", type=str, default="720p", help=f"Comma-separated sizes ({', '.join(SIZES)})")
+    parser.add_argument("--settings", type=str, default=",".join(SETTINGS), help=f"Comma-separated presets ({', '.join(SETTINGS)})")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--frames-per-minute", type=int, default=60)
+    parser.add_argument("--score-width", type=int, default=160)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is reported")
+    parser.add_argument("--output", type=str, help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    scenes, sizes, settings = args.scenes.split(","), args.sizes.split(","), args.settings.split(",")
+    for name, values, known in (("scene", scenes, SCENES), ("size", sizes, SIZES), ("settings preset", settings, SETTINGS)):
+        unknown = [value for value in values if value not in known]
+        if unknown:
+            parser.error(f"Unknown {name}: {', '.join(unknown)}")
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            width, height = SIZES[size]
+            for scene in scenes:
+                video = write_video(Path(temp_dir) / f"{scene}_{size}.mp4", scene, width, height, args.seconds, args.fps)
+                for preset in settings:
+                    case = {"scene": scene, "size": size, "settings": preset}
+                    if preset in NEEDS_FFMPEG and not has_ffmpeg():
+                        results.append({**case, "skipped": "ffmpeg not installed"})
+                        continue
+                    runs = []
+                    for _ in range(args.repeat):
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                            runs.append(executor.submit(run_case, str(video), SETTINGS[preset],
+                                                        args.frames_per_minute, args.score_width).result())
+                    result = {**case, **min(runs, key=lambda run: run["seconds"])}
+                    results.append(result)
+                    print(f"{scene:>7} {size:>6} {preset:<16} {result['seconds']:>8.2f}s "
+                          f"{result['video_fps']:>8.0f} fps {result['frames_selected']:>4} frames", file=sys.stderr)
+                os.remove(video)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "ffmpeg": has_ffmpeg(),
+            "cpus": os.cpu_count(),
+            "platform": platform.platform()
+        },
+        "parameters": {
+            "seconds": args.seconds,
+            "fps": args.fps,
+            "frames_per_minute": args.frames_per_minute,
+            "score_width": args.score_width,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
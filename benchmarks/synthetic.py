@@ -0,0 +1,70 @@
+"""Synthetic benchmark videos written with cv2.VideoWriter.
+
+Every scene is built from blocky noise (40 px blocks) so it survives the downscale to score
+thumbnails, and is seeded so the same arguments always produce the same video.
+"""
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+import cv2
+import numpy as np
+
+SIZES: Dict[str, Tuple[int, int]] = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+# Length in seconds of one shot in the "cuts" scene
+SHOT_SECONDS = 2
+BLOCK_SIZE = 40
+
+def _blocky_image(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    blocks = rng.integers(0, 256, size=(max(1, height // BLOCK_SIZE), max(1, width // BLOCK_SIZE), 3), dtype=np.uint8)
+    return cv2.resize(blocks, (width, height), interpolation=cv2.INTER_NEAREST)
+
+def _static(rng, width, height, num_frames, fps) -> Iterator[np.ndarray]:
+    """One image for the whole video, like a slide or a fixed camera on an empty room."""
+    image = _blocky_image(rng, width, height)
+    for _ in range(num_frames):
+        yield image
+
+def _pan(rng, width, height, num_frames, fps) -> Iterator[np.ndarray]:
+    """A slow horizontal camera pan, 2 px per frame, with no cuts."""
+    image = _blocky_image(rng, width, height)
+    for i in range(num_frames):
+        yield np.roll(image, 2 * i, axis=1)
+
+def _cuts(rng, width, height, num_frames, fps) -> Iterator[np.ndarray]:
+    """Static shots joined by hard cuts every SHOT_SECONDS seconds."""
+    for i in range(num_frames):
+        if i % (SHOT_SECONDS * fps) == 0:
+            image = _blocky_image(rng, width, height)
+        yield image
+
+def _noise(rng, width, height, num_frames, fps) -> Iterator[np.ndarray]:
+    """A new random image every frame, the worst case for both the encoder and the scorer."""
+    for _ in range(num_frames):
+        yield _blocky_image(rng, width, height)
+
+SCENES = {
+    "static": _static,
+    "pan": _pan,
+    "cuts": _cuts,
+    "noise": _noise,
+}
+
+def write_video(path: Path, scene: str, width: int, height: int, seconds: float, fps: int = 30) -> Path:
+    """Write a synthetic scene as an MPEG-4 Part 2 video, which has inter frames like H.264."""
+    if scene not in SCENES:
+        raise ValueError(f"Unknown scene: {scene} (expected one of {', '.join(SCENES)})")
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {path}")
+    rng = np.random.default_rng(0)
+    try:
+        for frame in SCENES[scene](rng, width, height, int(seconds * fps), fps):
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Tests for frame analysis requests in VideoAnalyzer."""
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from video_analyzer.analyzer import VideoAnalyzer
+from video_analyzer.audio_processor import AudioTranscript
+from video_analyzer.cli import analyze_frames, create_video_processor, reuse_journaled_results, run_settings
+from video_analyzer.clients import generic_openai_api
+from video_analyzer.clients.cache import CachedClient
+from video_analyzer.clients.generic_openai_api import GenericOpenAIAPIClient
+from video_analyzer.contact_sheet import build_contact_sheet, split_sheet_response
+from video_analyzer.config import Config, get_image_budget
+from video_analyzer.frame import Frame
+from video_analyzer.journal import Journal
+from video_analyzer.prompt import PromptLoader
+
+DEFAULT_CONFIG = Path(__file__).parent / "video_analyzer" / "config" / "default_config.json"
+
+class FakeClient:
+    """Records requests and answers each with a fixed or computed response."""
+
+    def __init__(self, respond=lambda prompt, image_bytes: "ok"):
+        self.respond = respond
+        self.requests = []
+
+    def generate(self, prompt, image_path=None, image_bytes=None, **kwargs):
+        self.requests.append({"prompt": prompt, "image_bytes": image_bytes, **kwargs})
+        return {"response": self.respond(prompt, image_bytes)}
+
+def _frames(count: int):
+    frames = []
+    for i in range(count):
+        ok, image = cv2.imencode(".jpg", np.full((48, 64, 3), i * 30, dtype=np.uint8))
+        frames.append(Frame(i, None, i * 2.0, 20.0, image=image.tobytes()))
+    return frames
+
+def _analyzer(client, **kwargs):
+    prompts = json.loads(DEFAULT_CONFIG.read_text())["prompts"]
+    return VideoAnalyzer(client, "test-model", PromptLoader("", prompts), 0.0, **kwargs)
+
+def test_contact_sheet_splits_response_per_frame():
+    def respond(prompt, image_bytes):
+        count = prompt.count("captured at")
+        return "\n".join(f"**Frame {i + 1}:** notes for tile {i + 1}" for i in range(count))
+
+    client = FakeClient(respond)
+    analyzer = _analyzer(client, contact_sheet=4)
+    analyses = list(analyzer.analyze_frames(_frames(6)))
+
+    assert len(client.requests) == 2
+    assert [a["response"] for a in analyses] == [f"notes for tile {i}" for i in (1, 2, 3, 4, 1, 2)]
+    assert [a["contact_sheet"] for a in analyses] == [0, 0, 0, 0, 1, 1]
+    sheet = cv2.imdecode(np.frombuffer(client.requests[0]["image_bytes"], dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert sheet.shape[1] > 2 * 512
+
+def test_concurrent_analysis_keeps_frame_order():
+    def respond(prompt, image_bytes):
+        number = int(prompt.rsplit("This is frame ", 1)[1].split()[0])
+        time.sleep(0.02 * (6 - number))  # Later frames finish first
+        if number == 2:
+            raise RuntimeError("backend unavailable")
+        return f"notes for frame {number}"
+
+    client = FakeClient(respond)
+    analyzer = _analyzer(client)
+    analyses = list(analyzer.analyze_frames(_frames(6), concurrency=4))
+
+    assert [a["response"] for a in analyses] == [
+        "notes for frame 0", "notes for frame 1", "Error analyzing frame 2: backend unavailable",
+        "notes for frame 3", "notes for frame 4", "notes for frame 5"
+    ]
+    assert analyzer.previous_analyses == analyses
+    assert analyzer.stats["frame_requests"] == 5
+    # Independent frames do not see each other's notes
+    assert not any("notes for frame" in request["prompt"] for request in client.requests)
+
+def test_context_policies_bound_previous_notes():
+    def respond(prompt, image_bytes):
+        return f"notes {len(client.requests) - 1} " + "x" * 80
+
+    for context, expected in (("all", [0, 1, 2, 3, 4]), ("last_k", [3, 4]), ("first_last_k", [0, 3, 4]),
+                              ("token_budget", [3, 4])):
+        client = FakeClient(respond)
+        analyzer = _analyzer(client, context=context, context_frames=2, context_tokens=60)
+        list(analyzer.analyze_frames(_frames(6)))
+        assert [i for i in range(5) if f"notes {i}" in client.requests[-1]["prompt"]] == expected
+        tokens = analyzer.stats["frame_prompt_tokens"]
+        # The first prompt has no previous notes; each kept note adds about 25 tokens
+        assert len(tokens) == 6 and 20 * len(expected) < tokens[-1] - tokens[0] < 30 * len(expected)
+
+def test_summary_context_folds_old_notes():
+    def respond(prompt, image_bytes):
+        if image_bytes is None:
+            return f"summary after {len(client.requests)} requests"
+        return f"notes {len(client.requests) - 1}"
+
+    client = FakeClient(respond)
+    analyzer = _analyzer(client, context="summary", context_frames=2, summary_interval=3, summary_model="small-model")
+    list(analyzer.analyze_frames(_frames(7)))
+
+    summaries = [r for r in client.requests if r["image_bytes"] is None]
+    assert [r["model"] for r in summaries] == ["small-model"]
+    assert "Frame 2\nnotes 2" in summaries[0]["prompt"] and "notes 3" not in summaries[0]["prompt"]
+    assert analyzer.summarized_frames == 3 and analyzer.stats["summary_requests"] == 1
+    # The last frame sees the summary and the notes since, not the folded notes
+    last_prompt = client.requests[-1]["prompt"]
+    assert "summary after 6 requests" in last_prompt
+    assert "Frame 3\nnotes 3" in last_prompt and "notes 0" not in last_prompt
+
+def test_long_reconstruction_is_summarized_in_chunks():
+    def respond(prompt, image_bytes):
+        if prompt.startswith("Video Part Summary"):
+            start = prompt.split("video, from ", 1)[1].split(" to ", 1)[0]
+            return f"part from {start}s: " + ("said hello" if "hello" in prompt else "silence")
+        return "final description"
+
+    client = FakeClient(respond)
+    analyzer = _analyzer(client, reconstruction_tokens=1500, chunk_frames=3)
+    frames = _frames(8)
+    analyses = [{"response": f"notes {i} " + "x" * 1000} for i in range(8)]
+    transcript = AudioTranscript("hello there", [{"text": "hello there", "start": 7.0, "end": 9.0}], "en")
+    assert analyzer.reconstruct_video(analyses, frames, transcript)["response"] == "final description"
+
+    chunks = [r["prompt"] for r in client.requests[:-1]]
+    assert len(chunks) == 3 and analyzer.stats["reconstruction_levels"] == 1
+    # Speech at 7-9s belongs with frames 3-5 (6-10s)
+    assert ["hello there" in prompt for prompt in chunks] == [False, True, False]
+    final = client.requests[-1]["prompt"]
+    assert "part from 6.00s: said hello" in final and "notes 3" not in final
+
+    client = FakeClient(respond)
+    _analyzer(client, reconstruction_tokens=1500, chunk_frames=3).reconstruct_video(analyses[:2], frames[:2])
+    assert len(client.requests) == 1
+
+def test_cached_client_reuses_responses(tmp_path):
+    client = FakeClient(lambda prompt, image_bytes: f"answer to {prompt}")
+    cache = CachedClient(client, tmp_path / "cache.sqlite", max_bytes=100)
+    assert cache.generate("a", image_bytes=b"frame 1", model="m")["response"] == "answer to a"
+    assert cache.generate("a", image_bytes=b"frame 1", model="m")["response"] == "answer to a"
+    cache.generate("a", image_bytes=b"frame 2", model="m")
+    cache.generate("a", image_bytes=b"frame 1", model="m", temperature=0.7)
+    assert len(client.requests) == 3
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+    cache.close()
+
+    # Entries survive reopening; the oldest are evicted once the cap is exceeded
+    cache = CachedClient(client, tmp_path / "cache.sqlite", max_bytes=100)
+    cache.generate("a", image_bytes=b"frame 2", model="m")
+    assert cache.hits == 1
+    for prompt in ("b", "c", "d"):
+        cache.generate(prompt, model="m")
+    stats = cache.stats()
+    assert stats["evictions"] and stats["bytes"] <= 100
+    cache.generate("d", model="m")
+    assert cache.hits == 2
+
+def test_resume_only_analyzes_missing_frames(tmp_path):
+    frames = _frames(6)
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.start(Path("video.mp4"), "test-model")
+    journal.record_frames(frames)
+    for i in (0, 1, 3):
+        journal.record_analysis(frames[i], {"response": f"recorded {i}"})
+    journal.record_analysis(frames[4], {"response": "Error analyzing frame 4", "error": True})
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"type": "analysis", "fra')  # Cut short by a crash
+
+    state = journal.load()
+    assert len(state.frames) == 6 and sorted(state.analyses) == [0, 1, 3]
+    client = FakeClient(lambda prompt, image_bytes: "new")
+    journal.reopen()
+    _, analyses = analyze_frames(_analyzer(client), frames, journal, state)
+    journal.close()
+
+    assert [a["response"] for a in analyses] == ["recorded 0", "recorded 1", "new", "recorded 3", "new", "new"]
+    # Frame 2 is analyzed with the recorded notes of frames 0 and 1 only
+    assert "recorded 1" in client.requests[0]["prompt"] and "recorded 3" not in client.requests[0]["prompt"]
+    assert sorted(journal.load().analyses) == list(range(6))
+
+def test_resume_streamed_run(tmp_path):
+    """A streamed run records no frame list; resuming matches the stream against its recorded analyses."""
+    frames = _frames(6)
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.start(Path("video.mp4"), "test-model")
+    for i in (0, 1, 4):
+        journal.record_analysis(frames[i], {"response": f"recorded {i}"})
+    journal.close()
+
+    state = journal.load()
+    assert state.frames is None
+    pulled = []
+
+    def stream():
+        for frame in frames:
+            pulled.append(frame.number)
+            yield frame
+
+    def respond(prompt, image_bytes):
+        return f"new after {len(pulled)} pulled"
+
+    client = FakeClient(respond)
+    journal.reopen()
+    analyzed, analyses = analyze_frames(_analyzer(client), stream(), journal, state)
+    journal.close()
+
+    assert [f.number for f in analyzed] == list(range(6))
+    assert [a["response"] for a in analyses] == [
+        "recorded 0", "recorded 1", "new after 3 pulled", "new after 4 pulled", "recorded 4", "new after 6 pulled"
+    ]
+    assert "recorded 1" in client.requests[0]["prompt"] and "recorded 4" in client.requests[2]["prompt"]
+    assert sorted(journal.load().analyses) == list(range(6))
+
+def test_resume_restores_context_summary(tmp_path):
+    def respond(prompt, image_bytes):
+        if image_bytes is None:
+            return f"summary {prompt.count('notes')}"
+        return "notes"
+
+    frames = _frames(8)
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.start(Path("video.mp4"), "test-model")
+    settings = dict(context="summary", context_frames=2, summary_interval=3)
+    analyze_frames(_analyzer(FakeClient(respond), **settings), frames[:6], journal, None)
+    journal.close()
+
+    state = journal.load()
+    assert sorted(state.summaries) == [3]
+    client = FakeClient(respond)
+    journal.reopen()
+    analyze_frames(_analyzer(client, **settings), frames, journal, state)
+    journal.close()
+    # The resumed run continues from the journaled summary instead of folding the old notes again
+    assert client.requests[0]["image_bytes"] is not None
+    assert "Summary of frames 0-2" in client.requests[0]["prompt"]
+    assert "Frame 2\n" not in client.requests[0]["prompt"] and "Frame 5\n" in client.requests[0]["prompt"]
+
+def test_restored_notes_folded_in_bounded_requests():
+    client = FakeClient(lambda prompt, image_bytes: "summary")
+    analyzer = _analyzer(client, context="summary", context_frames=2, summary_interval=3)
+    analyzer.restore_previous_analyses([{"response": f"notes {i}"} for i in range(20)])
+    assert len(client.requests) == 6 and analyzer.summarized_frames == 18
+    assert [request["prompt"].count("\nnotes ") for request in client.requests] == [3] * 6
+
+def test_split_sheet_response_formats():
+    response = "Frame 1: a person walks in\n\n[2] they sit down\n**Tile 3** the lights go out"
+    assert split_sheet_response(response, 4) == ["a person walks in", "they sit down", "the lights go out", None]
+    # Numbered lists inside a tile's notes are not tile headers
+    response = "Frame 1:\n1. Setting: kitchen\n2. Action: chops onions\nFrame 2:\n1. Setting: same\n2. Action: stove"
+    assert split_sheet_response(response, 2) == [
+        "1. Setting: kitchen\n2. Action: chops onions", "1. Setting: same\n2. Action: stove"
+    ]
+    # A plain numbered list is read as one entry per tile when there are no frame headers
+    assert split_sheet_response("1. a person walks in\n2) they sit down", 2) == ["a person walks in", "they sit down"]
+    assert split_sheet_response("no per-frame structure", 2) == [None, None]
+
+def test_contact_sheet_labels_tiles():
+    sheet = build_contact_sheet(_frames(3), tile_edge=64, columns=3)
+    image = cv2.imdecode(np.frombuffer(sheet, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    # Three tiles in one row, each with a dark label bar above it
+    assert image.shape[1] > 3 * 64 and image.shape[0] < 2 * 64
+
+def _config(tmp_path, clients=None, frames=None, default_client="ollama"):
+    """Default config with client and frames settings merged in, loaded from a user config.json."""
+    config = json.loads(DEFAULT_CONFIG.read_text())
+    config["clients"]["default"] = default_client
+    for client, settings in (clients or {}).items():
+        config["clients"][client].update(settings)
+    config["frames"].update(frames or {})
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    return Config(str(tmp_path))
+
+def test_default_image_budget(tmp_path):
+    config = _config(tmp_path)
+    assert get_image_budget(config) == {"max_edge": 1120, "format": "jpeg", "quality": 85}
+    processor = create_video_processor(config, tmp_path / "video.mp4", tmp_path, "test-model")
+    assert (processor.max_edge, processor.image_format, processor.image_quality) == (1120, "jpeg", 85)
+
+    config = _config(tmp_path, default_client="openai_api")
+    budget = get_image_budget(config)
+    assert (budget["max_edge"], budget["format"], budget["quality"]) == (1536, "jpeg", 85)
+
+def test_image_budget_precedence(tmp_path):
+    model = json.loads(DEFAULT_CONFIG.read_text())["clients"]["ollama"]["model"]
+    config = _config(tmp_path, clients={"ollama": {"image": {"max_edge": 800, "format": "webp", "quality": 70},
+                                                   "model_images": {model: {"max_edge": 512}}}},
+                     frames={"max_edge": 2000})
+    # The model's settings override the client's, key by key
+    assert get_image_budget(config) == {"max_edge": 512, "format": "webp", "quality": 70}
+    processor = create_video_processor(config, tmp_path / "video.mp4", tmp_path, model)
+    assert (processor.max_edge, processor.image_format, processor.image_quality) == (512, "webp", 70)
+
+    # frames.max_edge applies only when the image budget sets no max_edge
+    config = _config(tmp_path, clients={"ollama": {"image": {"quality": 60}}}, frames={"max_edge": 640})
+    processor = create_video_processor(config, tmp_path / "video.mp4", tmp_path, model)
+    assert (processor.max_edge, processor.image_format, processor.image_quality) == (640, "jpeg", 60)
+
+def test_image_mime_type_sniffing(tmp_path):
+    client = GenericOpenAIAPIClient("key", "http://localhost")
+    ok, png = cv2.imencode(".png", np.zeros((8, 8, 3), dtype=np.uint8))
+    ok, webp = cv2.imencode(".webp", np.zeros((8, 8, 3), dtype=np.uint8))
+    assert client.image_mime_type(image_bytes=png.tobytes()) == "image/png"
+    assert client.image_mime_type(image_bytes=webp.tobytes()) == "image/webp"
+    assert client.image_mime_type(image_bytes=_frames(1)[0].image) == "image/jpeg"
+    # Bytes take precedence over the file name
+    assert client.image_mime_type(str(tmp_path / "frame.jpg"), webp.tobytes()) == "image/webp"
+    assert client.image_mime_type(str(tmp_path / "frame.WEBP")) == "image/webp"
+    assert client.image_mime_type(str(tmp_path / "frame.png")) == "image/png"
+    assert client.image_mime_type(str(tmp_path / "frame.jpg")) == "image/jpeg"
+
+def test_openai_image_detail_hint(monkeypatch):
+    sent = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": "ok"}}]}
+
+    def post(url, headers=None, json=None):
+        sent.append(json)
+        return Response()
+
+    monkeypatch.setattr(generic_openai_api.requests, "post", post)
+    ok, webp = cv2.imencode(".webp", np.zeros((8, 8, 3), dtype=np.uint8))
+    GenericOpenAIAPIClient("key", "http://localhost", image_detail="low").generate("describe", image_bytes=webp.tobytes())
+    GenericOpenAIAPIClient("key", "http://localhost").generate("describe", image_bytes=webp.tobytes())
+    with_hint, without_hint = (request["messages"][0]["content"][1]["image_url"] for request in sent)
+    assert with_hint["detail"] == "low" and with_hint["url"].startswith("data:image/webp;base64,")
+    assert "detail" not in without_hint
+
+def test_run_settings_fingerprint_result_inputs(tmp_path):
+    prompts = json.loads(DEFAULT_CONFIG.read_text())["prompts"]
+    loader = PromptLoader("", prompts)
+    base = run_settings(_config(tmp_path), "test-model", loader, 100)
+    assert run_settings(_config(tmp_path, frames={"workers": 4, "decode_ahead": 2}), "test-model", loader, 100) == base
+
+    changed = run_settings(_config(tmp_path, frames={"per_minute": 30}), "test-model", loader, 100)
+    assert changed["frames"] != base["frames"] and changed["analysis"] == base["analysis"]
+    assert run_settings(_config(tmp_path), "test-model", loader, 10)["frames"] != base["frames"]
+
+    changed = run_settings(_config(tmp_path), "other-model", loader, 100)
+    assert changed["frames"] == base["frames"] and changed["analysis"] != base["analysis"]
+    config = _config(tmp_path)
+    config.config["prompt"] = "who is cooking?"
+    assert run_settings(config, "test-model", loader, 100)["analysis"] != base["analysis"]
+    edited = [dict(prompt, path=str(tmp_path / "frame.txt")) if i == 0 else prompt for i, prompt in enumerate(prompts)]
+    (tmp_path / "frame.txt").write_text("Describe this frame.")
+    assert run_settings(_config(tmp_path), "test-model", PromptLoader("", edited), 100)["analysis"] != base["analysis"]
+
+def _journaled_state(tmp_path, settings):
+    frames = _frames(3)
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.start(Path("video.mp4"), "test-model", settings)
+    journal.record_transcript(None)
+    journal.record_frames(frames)
+    for frame in frames:
+        journal.record_analysis(frame, {"response": f"recorded {frame.number}"})
+    journal.close()
+    return journal
+
+def test_journal_rewrite_is_atomic(tmp_path, monkeypatch):
+    settings = {"transcript": "t", "frames": "f", "analysis": "a"}
+    journal = _journaled_state(tmp_path, settings)
+    state = journal.load()
+    write = Journal._write
+
+    def interrupted(self, record):
+        if record["type"] == "analysis" and record["frame"] == 1:
+            raise KeyboardInterrupt
+        write(self, record)
+
+    monkeypatch.setattr(Journal, "_write", interrupted)
+    try:
+        journal.start(Path("video.mp4"), "test-model", settings, carry_over=state)
+    except KeyboardInterrupt:
+        pass
+    # The interrupted rewrite leaves the old journal as it was
+    assert sorted(journal.load().analyses) == [0, 1, 2]
+    assert [path.name for path in tmp_path.iterdir()] == ["journal.jsonl"]
+
+def test_journaled_results_reused_only_with_same_settings(tmp_path):
+    settings = {"transcript": "t", "frames": "f", "analysis": "a"}
+    journal = _journaled_state(tmp_path, settings)
+
+    state = journal.load()
+    assert not reuse_journaled_results(state, settings, reuse_analyses=True)
+    assert len(state.frames) == 3 and len(state.analyses) == 3
+
+    # --start-stage 2 without --resume analyzes every frame again
+    state = journal.load()
+    assert reuse_journaled_results(state, settings, reuse_analyses=False)
+    assert len(state.frames) == 3 and not state.analyses
+
+    state = journal.load()
+    assert reuse_journaled_results(state, dict(settings, analysis="other prompt"), reuse_analyses=True)
+    assert len(state.frames) == 3 and not state.analyses and state.transcript_recorded
+
+    state = journal.load()
+    assert reuse_journaled_results(state, dict(settings, frames="other budget"), reuse_analyses=True)
+    assert state.frames is None and not state.analyses and state.transcript_recorded
+
+    # A new journal carries over what is still reusable under the new settings
+    state = journal.load()
+    new_settings = dict(settings, analysis="other prompt")
+    reuse_journaled_results(state, new_settings, reuse_analyses=True)
+    journal.start(Path("video.mp4"), "test-model", new_settings, carry_over=state)
+    journal.close()
+    state = journal.load()
+    assert state.settings == new_settings and len(state.frames) == 3 and not state.analyses
+    assert state.transcript_recorded
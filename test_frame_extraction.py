@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Tests for keyframe extraction in VideoProcessor."""
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from video_analyzer.ffmpeg_reader import has_ffmpeg, probe_keyframes
+from video_analyzer.frame import VideoProcessor
+from video_analyzer.frame_scoring import metric_weights, score_batch
+from video_analyzer.frame_selection import TopKCandidates
+
+def _write_video(path: Path, num_frames: int = 120, fps: int = 30, size=(64, 48), fourcc: str = "MJPG") -> Path:
+    """Write a synthetic video whose brightness changes every 10 frames."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    for i in range(num_frames):
+        frame = np.full((size[1], size[0], 3), (i // 10) * 20 % 255, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def _extract(video: Path, output_dir: Path, processor_kwargs=None, **kwargs):
+    processor = VideoProcessor(video, output_dir, "test-model", **(processor_kwargs or {}))
+    kwargs.setdefault("frames_per_minute", 20)
+    return processor.extract_keyframes(**kwargs)
+
+def test_decode_modes_select_same_frames():
+    """Sparse decoding must not change which frames are selected."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi")
+        results = {
+            mode: [(f.timestamp, round(f.score, 3)) for f in _extract(video, Path(temp_dir) / mode, {"decode_mode": mode})]
+            for mode in VideoProcessor.DECODE_MODES
+        }
+        assert results["grab"] == results["read"]
+        assert results["seek"] == results["read"]
+        assert results["read"], "Expected at least one keyframe"
+
+def test_frames_are_chronological():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        frames = _extract(video, Path(temp_dir) / "frames")
+        assert [f.number for f in frames] == list(range(len(frames)))
+        assert [f.timestamp for f in frames] == sorted(f.timestamp for f in frames)
+        assert all(f.path.exists() for f in frames)
+
+def test_thumbnail_scoring_matches_full_resolution():
+    """Flat synthetic frames score identically on downscaled thumbnails."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi")
+        full = _extract(video, Path(temp_dir) / "full")
+        thumb = _extract(video, Path(temp_dir) / "thumb", {"score_width": 16})
+        assert [f.timestamp for f in thumb] == [f.timestamp for f in full]
+        assert all(abs(a.score - b.score) < 1.0 for a, b in zip(thumb, full))
+
+def test_parallel_segments_match_sequential():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        sequential = _extract(video, Path(temp_dir) / "sequential", frames_per_minute=60)
+        parallel = _extract(video, Path(temp_dir) / "parallel", {"workers": 3}, frames_per_minute=60)
+        assert [(f.number, f.timestamp, f.score) for f in parallel] == [(f.number, f.timestamp, f.score) for f in sequential]
+
+@pytest.mark.skipif(not has_ffmpeg(), reason="ffmpeg not installed")
+def test_ffmpeg_backend_matches_opencv():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        opencv = _extract(video, Path(temp_dir) / "opencv", frames_per_minute=60)
+        ffmpeg = _extract(video, Path(temp_dir) / "ffmpeg", {"backend": "ffmpeg", "workers": 2}, frames_per_minute=60)
+        assert [f.timestamp for f in ffmpeg] == [f.timestamp for f in opencv]
+
+def test_decode_ring_keeps_selected_frames_intact():
+    """Selected frames must be copied out of the ring before their buffers are reused."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        inline = _extract(video, Path(temp_dir) / "inline", {"decode_ahead": 0}, frames_per_minute=60)
+        processor = VideoProcessor(video, Path(temp_dir) / "ring", "test-model", write_frames=False,
+                                   score_batch_size=2, decode_ahead=1)
+        ring = processor.extract_keyframes(frames_per_minute=60)
+        assert [(f.timestamp, f.score) for f in ring] == [(f.timestamp, f.score) for f in inline]
+        for frame in ring:
+            image = cv2.imdecode(np.frombuffer(frame.image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            assert abs(image.mean() - (round(frame.timestamp * 30) // 10) * 20 % 255) < 2
+        assert processor.stats["decoded_frames"] > 0
+
+        # Abandoning a stream part-way must stop the decoder thread
+        streamed = processor.iter_keyframes(frames_per_minute=60)
+        next(streamed)
+        streamed.close()
+
+def test_max_edge_downscales_saved_frames():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi")
+        frames = _extract(video, Path(temp_dir) / "frames", {"max_edge": 32})
+        assert cv2.imread(str(frames[0].path)).shape == (24, 32, 3)
+
+def test_score_index_reused_for_smaller_budget(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        index_dir = Path(temp_dir) / "index"
+        first = _extract(video, Path(temp_dir) / "first", {"index_dir": index_dir}, frames_per_minute=60)
+        assert list(index_dir.glob("*.npz"))
+
+        def fail_scan(*args, **kwargs):
+            raise AssertionError("video should not be rescanned")
+        monkeypatch.setattr(VideoProcessor, "_scan", fail_scan)
+        again = _extract(video, Path(temp_dir) / "again", {"index_dir": index_dir}, frames_per_minute=60)
+        assert [(f.timestamp, f.score) for f in again] == [(f.timestamp, f.score) for f in first]
+        # A smaller budget samples more coarsely, so it needs the finer index reused
+        fewer = _extract(video, Path(temp_dir) / "fewer", {"index_dir": index_dir, "index_reuse_finer": True},
+                         frames_per_minute=60, max_frames=3)
+        assert len(fewer) == 3
+        assert all(f.path.exists() for f in fewer)
+
+def test_finer_score_index_only_reused_when_enabled(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        index_dir = Path(temp_dir) / "index"
+        fresh = _extract(video, Path(temp_dir) / "fresh", frames_per_minute=20)
+        _extract(video, Path(temp_dir) / "fine", {"index_dir": index_dir}, frames_per_minute=60)
+
+        scans = []
+        original_scan = VideoProcessor._scan
+        monkeypatch.setattr(VideoProcessor, "_scan", lambda self, *args: scans.append(args) or original_scan(self, *args))
+        coarse = _extract(video, Path(temp_dir) / "coarse", {"index_dir": index_dir}, frames_per_minute=20)
+        assert len(scans) == 1
+        assert [f.timestamp for f in coarse] == [f.timestamp for f in fresh]
+
+        _extract(video, Path(temp_dir) / "reused", {"index_dir": Path(temp_dir) / "index2"}, frames_per_minute=60)
+        _extract(video, Path(temp_dir) / "reused", {"index_dir": Path(temp_dir) / "index2", "index_reuse_finer": True},
+                 frames_per_minute=20)
+        assert len(scans) == 2
+
+def test_in_memory_frames_skip_disk():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = Path(temp_dir) / "frames"
+        frames = _extract(_write_video(Path(temp_dir) / "video.avi"), output_dir, {"write_frames": False})
+        assert frames and not output_dir.exists()
+        assert all(f.path is None and f.image.startswith(b"\xff\xd8") for f in frames)
+
+def test_streaming_yields_one_frame_per_bucket():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        processor = VideoProcessor(video, Path(temp_dir) / "frames", "test-model")
+        frames = list(processor.iter_keyframes(frames_per_minute=30))
+        assert frames == processor.frames
+        assert [f.number for f in frames] == list(range(len(frames)))
+        # 10 seconds at 30 frames per minute gives five 2-second buckets
+        assert len(frames) == 5
+        assert [int(f.timestamp // 2) for f in frames] == list(range(5))
+
+def test_streaming_extracts_ahead_of_consumer():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        inline = list(VideoProcessor(video, Path(temp_dir) / "inline", "test-model", stream_ahead=0)
+                      .iter_keyframes(frames_per_minute=30))
+        processor = VideoProcessor(video, Path(temp_dir) / "ahead", "test-model", stream_ahead=2)
+        streamed = processor.iter_keyframes(frames_per_minute=30)
+        first = next(streamed)
+        # Extraction continues on its thread while the first frame is being worked on
+        deadline = time.monotonic() + 5
+        while len(processor.frames) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(processor.frames) >= 3
+        frames = [first] + list(streamed)
+        assert [(f.timestamp, f.score) for f in frames] == [(f.timestamp, f.score) for f in inline]
+
+        streamed = processor.iter_keyframes(frames_per_minute=30)
+        next(streamed)
+        streamed.close()
+        assert not any(thread.name == "keyframe-stream" for thread in threading.enumerate())
+
+def test_near_duplicates_suppressed():
+    """Cutting back and forth between two shots should yield one frame per shot."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+        ramp = np.tile(np.linspace(0, 255, 64, dtype=np.uint8)[None, :, None], (48, 1, 3))
+        shots = [ramp, ramp[:, ::-1].copy()]
+        for i in range(300):
+            writer.write(shots[(i // 15) % 2])
+        writer.release()
+
+        processor = VideoProcessor(path, Path(temp_dir) / "frames", "test-model", dedup_distance=5)
+        frames = processor.extract_keyframes(frames_per_minute=60)
+        assert len(frames) == 2
+        assert processor.stats["near_duplicates_suppressed"] > 0
+
+def test_selection_strategies_spread_frames():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        frames = _extract(video, Path(temp_dir) / "nms", {"selection": "nms", "nms_window": 1.5}, frames_per_minute=30)
+        timestamps = [f.timestamp for f in frames]
+        assert all(b - a >= 1.5 for a, b in zip(timestamps, timestamps[1:]))
+
+        frames = _extract(video, Path(temp_dir) / "bucket", {"selection": "bucket"}, frames_per_minute=30)
+        # 10 seconds at 30 frames per minute gives five 2-second buckets
+        assert [int(f.timestamp // 2) for f in frames] == list(range(5))
+
+def test_nms_scan_matches_score_index():
+    """Scores rising along a chain of nearby frames must not change which frames NMS keeps."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+        for i in range(900):
+            # Brightness flips around mid-grey every sampling interval (15 frames) with a growing
+            # amplitude, so every sampled frame scores higher than the one before it
+            sample = i // 15
+            brightness = 128 + (-1) ** sample * (10 + sample * 3) // 2
+            writer.write(np.full((48, 64, 3), brightness, dtype=np.uint8))
+        writer.release()
+
+        settings = {"selection": "nms", "nms_window": 2.5, "index_dir": Path(temp_dir) / "index"}
+        scanned = _extract(path, Path(temp_dir) / "scan", settings, frames_per_minute=60)
+        indexed = _extract(path, Path(temp_dir) / "index_run", settings, frames_per_minute=60)
+        parallel = _extract(path, Path(temp_dir) / "parallel", {"selection": "nms", "nms_window": 2.5, "workers": 3},
+                            frames_per_minute=60)
+        assert len(scanned) > 1
+        assert [f.timestamp for f in scanned] == [f.timestamp for f in indexed] == [f.timestamp for f in parallel]
+
+@pytest.mark.skipif(not has_ffmpeg(), reason="ffmpeg not installed")
+def test_keyframe_candidates():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.mp4", num_frames=300, fourcc="mp4v")
+        keyframes = probe_keyframes(video, 30)
+        assert keyframes and len(keyframes) < 300
+        processor = VideoProcessor(video, Path(temp_dir) / "frames", "test-model", candidate_source="keyframes")
+        frames = processor.extract_keyframes(frames_per_minute=30)
+        assert len(frames) == 5
+        assert all(round(f.timestamp * 30) in keyframes for f in frames)
+
+        # Every MJPEG frame is a keyframe, so candidates fall back to sampling
+        video = _write_video(Path(temp_dir) / "video.avi", num_frames=300)
+        assert len(_extract(video, Path(temp_dir) / "mjpeg", {"candidate_source": "keyframes"}, frames_per_minute=30)) == 5
+
+def test_keyframe_score_index_reused_at_any_budget(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = _write_video(Path(temp_dir) / "video.mp4", num_frames=300, fourcc="mp4v")
+        index_dir = Path(temp_dir) / "index"
+        settings = {"candidate_source": "keyframes", "index_dir": index_dir}
+        first = _extract(video, Path(temp_dir) / "first", settings, frames_per_minute=30)
+
+        scans = []
+        original_scan = VideoProcessor._scan
+        monkeypatch.setattr(VideoProcessor, "_scan", lambda self, *args: scans.append(args) or original_scan(self, *args))
+        again = _extract(video, Path(temp_dir) / "again", settings, frames_per_minute=30)
+        assert [(f.timestamp, f.score) for f in again] == [(f.timestamp, f.score) for f in first]
+        # Keyframe candidates do not depend on the sample interval, so other budgets reuse the index too
+        assert len(_extract(video, Path(temp_dir) / "fewer", settings, frames_per_minute=12)) == 2
+        assert not scans
+
+def test_adaptive_budget_follows_activity():
+    """A minute of motion between two static minutes gets most of a smaller budget."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+        for i in range(1800):
+            brightness = (i // 10) * 40 % 255 if 600 <= i < 1200 else 100
+            writer.write(np.full((48, 64, 3), brightness, dtype=np.uint8))
+        writer.release()
+
+        fixed = _extract(path, Path(temp_dir) / "fixed", frames_per_minute=10)
+        processor = VideoProcessor(path, Path(temp_dir) / "adaptive", "test-model", budget="adaptive")
+        frames = processor.extract_keyframes(frames_per_minute=10)
+        per_minute = np.bincount([int(f.timestamp // 60) for f in frames], minlength=3)
+        assert len(frames) < len(fixed)
+        assert per_minute[0] == per_minute[2] == 1
+        assert per_minute[1] > 1
+
+def test_letterbox_crop_removes_bars():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (128, 96))
+        for i in range(120):
+            frame = np.zeros((96, 128, 3), dtype=np.uint8)
+            frame[24:72] = (i // 10) * 20 % 255 + 30
+            writer.write(frame)
+        writer.release()
+
+        processor = VideoProcessor(path, Path(temp_dir) / "frames", "test-model", write_frames=False, crop="letterbox")
+        frames = processor.extract_keyframes(frames_per_minute=20)
+        images = [cv2.imdecode(np.frombuffer(f.image, dtype=np.uint8), cv2.IMREAD_COLOR) for f in frames]
+        assert frames and all(image.shape[1] == 128 and image.shape[0] < 72 for image in images)
+        assert processor.stats["crop"]["height"] < 72
+
+def test_batch_scoring_matches_pairwise():
+    rng = np.random.default_rng(0)
+    thumbnails = rng.integers(0, 255, size=(6, 45, 80), dtype=np.uint8)
+    weights = metric_weights({"absdiff": 1, "histogram": 1, "edges": 1, "ssim": 1})
+    batch = score_batch(thumbnails[1:], thumbnails[0], weights)
+    pairwise = [score_batch(current[None], previous, weights)[0] for previous, current in zip(thumbnails, thumbnails[1:])]
+    np.testing.assert_allclose(batch, pairwise)
+    assert score_batch(thumbnails[:1], None, weights)[0] == 0
+    with pytest.raises(ValueError):
+        metric_weights("psnr")
+
+def test_top_k_matches_full_sort():
+    """The bounded heap keeps the same frames as sorting every candidate, ties going to earlier frames."""
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 20, size=500).astype(float)
+    candidates = [(i, None, score) for i, score in enumerate(scores)]
+    top_k = TopKCandidates(25)
+    top_k.extend(candidates)
+    expected = sorted(candidates, key=lambda x: x[2], reverse=True)[:25]
+    assert [(n, s) for n, _, s in top_k.ranked()] == [(n, s) for n, _, s in expected]
+
+def test_webp_frames_follow_quality():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (128, 96))
+        rng = np.random.default_rng(0)
+        for _ in range(60):
+            writer.write(rng.integers(0, 255, (96, 128, 3), dtype=np.uint8))
+        writer.release()
+        sizes = []
+        for quality in (20, 90):
+            frames = _extract(path, Path(temp_dir) / f"frames{quality}",
+                              {"write_frames": False, "image_format": "webp", "image_quality": quality})
+            assert all(f.image[:4] == b"RIFF" and f.image[8:12] == b"WEBP" for f in frames)
+            sizes.append(sum(len(f.image) for f in frames))
+        assert sizes[0] < sizes[1]
+
+def test_unknown_image_format_rejected():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with pytest.raises(ValueError):
+            VideoProcessor(_write_video(Path(temp_dir) / "video.avi"), Path(temp_dir) / "frames", "test-model",
+                           image_format="gif")
+
+@pytest.mark.skipif(not has_ffmpeg(), reason="ffmpeg not installed")
+def test_ffmpeg_crop_keeps_source_resolution():
+    """Cropped frames must not be upscaled from the ffmpeg backend's downscaled decode."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "video.avi"
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (128, 96))
+        checkers = np.indices((96, 64)).sum(axis=0) % 2 * 200
+        for i in range(120):
+            frame = np.zeros((96, 128, 3), dtype=np.uint8)
+            frame[:, 32:96] = (checkers + (i // 10) * 5)[..., None]
+            writer.write(frame)
+        writer.release()
+
+        images = {}
+        for backend in ("opencv", "ffmpeg"):
+            processor = VideoProcessor(path, Path(temp_dir) / backend, "test-model", write_frames=False,
+                                       crop="letterbox", max_edge=64, backend=backend)
+            frames = processor.extract_keyframes(frames_per_minute=20)
+            images[backend] = [cv2.imdecode(np.frombuffer(f.image, dtype=np.uint8), cv2.IMREAD_COLOR) for f in frames]
+        assert images["ffmpeg"] and len(images["ffmpeg"]) == len(images["opencv"])
+        for ffmpeg_image, opencv_image in zip(images["ffmpeg"], images["opencv"]):
+            assert ffmpeg_image.shape == opencv_image.shape and ffmpeg_image.shape[0] == 64
+            assert np.abs(ffmpeg_image.astype(int) - opencv_image.astype(int)).mean() < 2
@@ -80,6 +80,14 @@ def test_frame_image_paths_resolved(training_data_file, output_dir):
         assert frame.image_path.exists()
 
 
+def test_webp_frame_images_found(output_dir):
+    frames_dir = output_dir / "frames"
+    for path in frames_dir.iterdir():
+        path.rename(path.with_suffix(".webp"))
+    examples = load_training_data(str(output_dir))
+    assert all(frame.image_path is not None and frame.image_path.suffix == ".webp" for frame in examples[0].frames)
+
+
 def test_has_ideal_frame_notes_true(training_data_file):
     examples = load_training_data(str(training_data_file))
     assert examples[0].has_ideal_frame_notes is True
@@ -39,7 +39,7 @@ def _find_frame_images(frames_dir: Path, count: int) -> List[Optional[Path]]:
         return [None] * count
 
     images = sorted(
-        [p for p in frames_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")],
+        [p for p in frames_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")],
         key=lambda p: p.name,
     )
 
@@ -1,14 +1,30 @@
-from typing import List, Dict, Any, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import logging
+import threading
+import time
 from .clients.llm_client import LLMClient
 from .prompt import PromptLoader
 from .frame import Frame
+from .contact_sheet import build_contact_sheet, split_sheet_response
 from .audio_processor import AudioTranscript
 
 logger = logging.getLogger(__name__)
 
+# How much of the previous frame notes goes into each frame prompt
+CONTEXT_POLICIES = ("all", "last_k", "first_last_k", "token_budget", "summary")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of text, about four characters per token for English prose."""
+    return (len(text) + 3) // 4
+
 class VideoAnalyzer:
-    def __init__(self, client: LLMClient, model: str, prompt_loader: PromptLoader, temperature: float, user_prompt: str = ""):
+    def __init__(self, client: LLMClient, model: str, prompt_loader: PromptLoader, temperature: float, user_prompt: str = "",
+                 contact_sheet: int = 0, tile_edge: int = 512, concurrency: int = 1, context: str = "all",
+                 context_frames: int = 5, context_tokens: int = 2000, summary_interval: int = 10,
+                 summary_model: Optional[str] = None, reconstruction_tokens: int = 12000, chunk_frames: int = 20,
+                 chunk_workers: int = 4):
         """Initialize the VideoAnalyzer.
         
         Args:
@@ -17,14 +33,53 @@ class VideoAnalyzer:
             prompt_loader: Loader for prompt templates
             user_prompt: Optional user question about the video that will be injected into frame analysis
                         and video description prompts using the {prompt} token
+            contact_sheet: Number of consecutive frames tiled into one labelled grid image and
+                        analyzed in a single request. 0 or 1 sends every frame on its own
+            tile_edge: Longest edge in pixels of each frame on a contact sheet
+            concurrency: Number of frame requests (or contact sheets) in flight at once. Above 1,
+                        frames are analyzed independently: their prompts do not include the
+                        notes of previous frames
+            context: Which previous frame notes fill {PREVIOUS_FRAMES}: "all", "last_k" (the last
+                        context_frames), "first_last_k" (the first frame and the last
+                        context_frames) or "token_budget" (the most recent notes that fit in
+                        context_tokens estimated tokens) or "summary" (a running summary of older
+                        frames plus the notes of the frames since)
+            context_frames: Number of most recent frames kept by "last_k", "first_last_k" and "summary"
+            context_tokens: Estimated token budget of the previous frame notes for "token_budget"
+            summary_interval: With "summary", once this many notes are older than the last
+                        context_frames they are folded into the summary with one text-only request
+            summary_model: Model of the summary requests. None uses model
+            reconstruction_tokens: Estimated prompt tokens above which the video is reconstructed
+                        hierarchically: chunks of frame notes are summarized first and the final
+                        description is written from the chunk summaries. 0 always uses one request
+            chunk_frames: Frames (or, at higher levels, summaries) per chunk in hierarchical reconstruction
+            chunk_workers: Chunk summary requests in flight at once in hierarchical reconstruction
         """
+        if context not in CONTEXT_POLICIES:
+            raise ValueError(f"Unknown context policy: {context} (expected one of {', '.join(CONTEXT_POLICIES)})")
         self.client = client
         self.model = model
         self.prompt_loader = prompt_loader
         self.temperature = temperature
         self.user_prompt = user_prompt  # Store user's question about the video
+        self.contact_sheet = contact_sheet if contact_sheet > 1 else 0
+        self.tile_edge = tile_edge
+        self.concurrency = max(1, concurrency)
+        self.context = context
+        self.context_frames = max(0, context_frames)
+        self.context_tokens = max(0, context_tokens)
+        self.summary_interval = max(1, summary_interval)
+        self.summary_model = summary_model or model
+        self.summary = ""
+        self.summarized_frames = 0  # Leading previous_analyses already folded into the summary
+        self.reconstruction_tokens = max(0, reconstruction_tokens)
+        self.chunk_frames = max(2, chunk_frames)
+        self.chunk_workers = max(1, chunk_workers)
         self._load_prompts()
         self.previous_analyses = []
+        self.stats: Dict[str, Any] = {"frame_requests": 0, "frame_request_seconds": 0.0, "frame_payload_bytes": 0,
+                                      "frame_prompt_tokens": []}
+        self._stats_lock = threading.Lock()
         
     def _format_user_prompt(self) -> str:
         """Format the user's prompt by adding prefix if not empty."""
@@ -36,63 +91,277 @@ class VideoAnalyzer:
         """Load prompts from files."""
         self.frame_prompt = self.prompt_loader.get_by_index(0)  # Frame Analysis prompt
         self.video_prompt = self.prompt_loader.get_by_index(1)  # Video Reconstruction prompt
+        if self.contact_sheet:
+            self.sheet_prompt = self.prompt_loader.get_by_name("Contact Sheet")
+        if self.context == "summary":
+            self.summary_prompt = self.prompt_loader.get_by_name("Context Summary")
+        self.chunk_prompt = None
+        if self.reconstruction_tokens:
+            if any(prompt.get("name") == "Chunk Summary" for prompt in self.prompt_loader.prompts):
+                self.chunk_prompt = self.prompt_loader.get_by_name("Chunk Summary")
+            else:
+                logger.warning("No \"Chunk Summary\" prompt configured, long videos are reconstructed in one request")
+
+    def _context_analyses(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Previous analyses, with their frame index, selected by the context policy."""
+        indexed = list(enumerate(self.previous_analyses))
+        if self.context == "last_k":
+            return indexed[-self.context_frames:] if self.context_frames else []
+        if self.context == "first_last_k":
+            recent = indexed[max(1, len(indexed) - self.context_frames):] if self.context_frames else []
+            return indexed[:1] + recent
+        if self.context == "token_budget":
+            kept, tokens = [], 0
+            for i, analysis in reversed(indexed):
+                tokens += estimate_tokens(self._format_analysis(i, analysis))
+                if tokens > self.context_tokens:
+                    break
+                kept.append((i, analysis))
+            return kept[::-1]
+        if self.context == "summary":
+            return indexed[self.summarized_frames:]
+        return indexed
+
+    def restore_previous_analyses(self, analyses: List[Dict[str, Any]], summary: str = "",
+                                  summarized_frames: int = 0) -> None:
+        """Continue from the analyses of the frames before the next one, e.g. when resuming a run.
+
+        Args:
+            analyses: Analyses of the frames before the next one, in frame order
+            summary: With the "summary" context policy, the summary of the leading analyses
+            summarized_frames: Number of leading analyses folded into summary
+        """
+        self.previous_analyses = list(analyses)
+        self.summary = summary
+        self.summarized_frames = summarized_frames
+        # Notes beyond a restored summary are folded in as they would have been, a few at a time
+        self._refresh_summary()
+
+    def _format_analysis(self, i: int, analysis: Dict[str, Any]) -> str:
+        return f"Frame {i}\n{analysis.get('response', 'No analysis available')}\n"
 
     def _format_previous_analyses(self) -> str:
         """Format previous frame analyses for inclusion in prompt."""
-        if not self.previous_analyses:
-            return ""
-            
-        formatted_analyses = []
-        for i, analysis in enumerate(self.previous_analyses):
-            formatted_analysis = (
-                f"Frame {i}\n"
-                f"{analysis.get('response', 'No analysis available')}\n"
+        notes = "\n".join(self._format_analysis(i, analysis) for i, analysis in self._context_analyses())
+        if self.context == "summary" and self.summary:
+            return f"Summary of frames 0-{self.summarized_frames - 1}\n{self.summary}\n\n{notes}"
+        return notes
+
+    def _refresh_summary(self) -> None:
+        """Fold the notes older than the last context_frames into the summary once enough have built up.
+
+        Each request folds at most summary_interval notes, so its prompt stays bounded however
+        many notes are waiting.
+        """
+        if self.context != "summary":
+            return
+        while len(self.previous_analyses) - self.context_frames - self.summarized_frames >= self.summary_interval:
+            if not self._fold_summary(self.summarized_frames + self.summary_interval):
+                return
+
+    def _fold_summary(self, end: int) -> bool:
+        """Fold the notes up to end into the summary with one request. Returns False if it failed."""
+        notes = "\n".join(
+            self._format_analysis(i, self.previous_analyses[i]) for i in range(self.summarized_frames, end)
+        )
+        prompt = self.summary_prompt.replace("{SUMMARY}", self.summary or "No summary yet, these are the first frames.")
+        prompt = prompt.replace("{FRAME_NOTES}", notes)
+        prompt = prompt.replace("{prompt}", self._format_user_prompt())
+        start = time.perf_counter()
+        try:
+            response = self.client.generate(
+                prompt=prompt,
+                model=self.summary_model,
+                temperature=self.temperature,
+                num_predict=400
             )
-            formatted_analyses.append(formatted_analysis)
-            
-        return "\n".join(formatted_analyses)
+        except Exception as e:
+            # The notes stay in the prompt as they are and are folded in on a later frame
+            logger.error(f"Error summarizing frames {self.summarized_frames}-{end - 1}: {e}")
+            return False
+        self.summary = response.get("response", "").strip()
+        self.summarized_frames = end
+        self.stats["summary_requests"] = self.stats.get("summary_requests", 0) + 1
+        self.stats["summary_request_seconds"] = self.stats.get("summary_request_seconds", 0.0) + time.perf_counter() - start
+        logger.debug(f"Folded frames up to {end - 1} into the context summary ({estimate_tokens(self.summary)} tokens)")
+        return True
+
+    def _record_prompt(self, prompt: str) -> None:
+        """Add the estimated token count of one frame request prompt to the stats, in request order."""
+        self.stats["frame_prompt_tokens"].append(estimate_tokens(prompt))
+
+    def _record_request(self, elapsed: float, payload_bytes: int) -> None:
+        """Add one successful frame request to the stats. Requests may complete on worker threads."""
+        with self._stats_lock:
+            self.stats["frame_requests"] += 1
+            self.stats["frame_request_seconds"] += elapsed
+            self.stats["frame_payload_bytes"] += payload_bytes
 
     def analyze_frame(self, frame: Frame) -> Dict[str, Any]:
         """Analyze a single frame using the LLM."""
-        # Replace {PREVIOUS_FRAMES} token with formatted previous analyses
+        analysis_result = self._request_frame(frame, self._frame_prompt(frame, self._format_previous_analyses()))
+        # Store the analysis for future frames
+        self.previous_analyses.append(analysis_result)
+        self._refresh_summary()
+        return analysis_result
+
+    def _frame_prompt(self, frame: Frame, previous_frames: str) -> str:
+        """Build the prompt for one frame with the given previous frame notes."""
         # Replace tokens in the prompt template
-        prompt = self.frame_prompt.replace("{PREVIOUS_FRAMES}", self._format_previous_analyses())
+        prompt = self.frame_prompt.replace("{PREVIOUS_FRAMES}", previous_frames)
         prompt = prompt.replace("{prompt}", self._format_user_prompt())
         prompt = f"{prompt}\nThis is frame {frame.number} captured at {frame.timestamp:.2f} seconds."
-        
+        self._record_prompt(prompt)
+        return prompt
+
+    def _request_frame(self, frame: Frame, prompt: str) -> Dict[str, Any]:
+        """Send one frame to the LLM and return its analysis."""
+        payload_bytes = len(frame.image) if frame.image is not None else (frame.path.stat().st_size if frame.path else 0)
+        start = time.perf_counter()
         try:
             response = self.client.generate(
                 prompt=prompt,
-                image_path=str(frame.path),
+                image_path=str(frame.path) if frame.path else None,
+                image_bytes=frame.image,
                 model=self.model,
                 temperature=self.temperature,
                 num_predict=300
             )
-            logger.debug(f"Successfully analyzed frame {frame.number}")
-            
-            # Store the analysis for future frames
-            analysis_result = {k: v for k, v in response.items() if k != "context"}
-            self.previous_analyses.append(analysis_result)
-            
-            return analysis_result
+            elapsed = time.perf_counter() - start
+            self._record_request(elapsed, payload_bytes)
+            logger.debug(f"Successfully analyzed frame {frame.number} ({payload_bytes / 1024:.0f} KB image, {elapsed:.2f}s)")
+            return {k: v for k, v in response.items() if k != "context"}
         except Exception as e:
             logger.error(f"Error analyzing frame {frame.number}: {e}")
-            error_result = {"response": f"Error analyzing frame {frame.number}: {str(e)}"}
-            self.previous_analyses.append(error_result)
-            return error_result
+            return {"response": f"Error analyzing frame {frame.number}: {str(e)}", "error": True}
+
+    def _iter_requests(self, frames: Iterable[Frame]) -> Iterator[List[Frame]]:
+        """Group frames into the frames of each request: one each, or contact_sheet per sheet."""
+        size = self.contact_sheet or 1
+        batch: List[Frame] = []
+        for frame in frames:
+            batch.append(frame)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def analyze_frames(self, frames: Iterable[Frame], concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Analyze frames in order, yielding one analysis per frame.
+
+        frames may be a stream that is still being extracted. With contact sheets enabled, every
+        contact_sheet consecutive frames are sent as one request.
+
+        Args:
+            frames: Frames to analyze, in chronological order
+            concurrency: Requests in flight at once, overriding the analyzer's concurrency. Above 1
+                        frames are analyzed independently of each other; analyses are still
+                        yielded in frame order and failed requests still yield an error analysis
+        """
+        concurrency = max(1, concurrency or self.concurrency)
+        if concurrency == 1:
+            for batch in self._iter_requests(frames):
+                if self.contact_sheet:
+                    yield from self.analyze_contact_sheet(batch)
+                else:
+                    yield self.analyze_frame(batch[0])
+            return
+
+        # Requests are submitted ahead and collected oldest first, so a slow request holds back
+        # the results after it but never more than 2 * concurrency requests are queued
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for batch in self._iter_requests(frames):
+                pending.append(self._submit_independent(executor, batch))
+                if len(pending) >= 2 * concurrency:
+                    yield from self._collect(pending.popleft())
+            while pending:
+                yield from self._collect(pending.popleft())
+
+    def _submit_independent(self, executor: ThreadPoolExecutor, frames: List[Frame]):
+        """Submit the request for frames without the notes of previous frames."""
+        if self.contact_sheet:
+            # Sheets are numbered here, in order, rather than on the worker threads
+            sheet_number = self.stats.get("contact_sheets", 0)
+            self.stats["contact_sheets"] = sheet_number + 1
+            return executor.submit(self._request_contact_sheet, frames, sheet_number, self._sheet_prompt(frames, ""))
+        prompt = self._frame_prompt(frames[0], "")
+        return executor.submit(lambda: [self._request_frame(frames[0], prompt)])
+
+    def _collect(self, future) -> List[Dict[str, Any]]:
+        """Wait for a submitted request and record its analyses in frame order."""
+        results = future.result()
+        self.previous_analyses.extend(results)
+        return results
+
+    def analyze_contact_sheet(self, frames: List[Frame]) -> List[Dict[str, Any]]:
+        """Analyze consecutive frames tiled into one contact sheet and split the notes per frame."""
+        sheet_number = self.stats.get("contact_sheets", 0)
+        self.stats["contact_sheets"] = sheet_number + 1
+        results = self._request_contact_sheet(frames, sheet_number, self._sheet_prompt(frames, self._format_previous_analyses()))
+        self.previous_analyses.extend(results)
+        self._refresh_summary()
+        return results
+
+    def _sheet_prompt(self, frames: List[Frame], previous_frames: str) -> str:
+        """Build the prompt for a contact sheet of frames with the given previous frame notes."""
+        tile_list = "\n".join(
+            f"Frame {i + 1}: frame {frame.number} captured at {frame.timestamp:.2f} seconds"
+            for i, frame in enumerate(frames)
+        )
+        prompt = self.sheet_prompt.replace("{PREVIOUS_FRAMES}", previous_frames)
+        prompt = prompt.replace("{prompt}", self._format_user_prompt())
+        prompt = prompt.replace("{TILE_COUNT}", str(len(frames)))
+        prompt = prompt.replace("{TILE_LIST}", tile_list)
+        self._record_prompt(prompt)
+        return prompt
+
+    def _request_contact_sheet(self, frames: List[Frame], sheet_number: int, prompt: str) -> List[Dict[str, Any]]:
+        """Send frames as one contact sheet and split the response into per-frame notes."""
+        frame_range = f"{frames[0].number}-{frames[-1].number}"
+
+        start = time.perf_counter()
+        try:
+            image = build_contact_sheet(frames, self.tile_edge)
+            response = self.client.generate(
+                prompt=prompt,
+                image_bytes=image,
+                model=self.model,
+                temperature=self.temperature,
+                num_predict=300 * len(frames)
+            )
+            elapsed = time.perf_counter() - start
+            self._record_request(elapsed, len(image))
+            logger.debug(f"Successfully analyzed frames {frame_range} on one contact sheet ({len(image) / 1024:.0f} KB image, {elapsed:.2f}s)")
+
+            text = response.get("response", "")
+            notes = split_sheet_response(text, len(frames))
+            if not any(notes):
+                # The model ignored the per-frame layout; keep its notes rather than lose them
+                logger.warning(f"Could not split contact sheet response for frames {frame_range} into frames")
+                notes = [text] * len(frames)
+            return [
+                {
+                    "response": note if note is not None else f"No separate notes for frame {frame.number} in the contact sheet response",
+                    "contact_sheet": sheet_number,
+                    "tile": i + 1
+                }
+                for i, (frame, note) in enumerate(zip(frames, notes))
+            ]
+        except Exception as e:
+            logger.error(f"Error analyzing frames {frame_range}: {e}")
+            return [{"response": f"Error analyzing frame {frame.number}: {str(e)}", "error": True} for frame in frames]
 
     def reconstruct_video(self, frame_analyses: List[Dict[str, Any]], frames: List[Frame], 
                          transcript: Optional[AudioTranscript] = None) -> Dict[str, Any]:
-        """Reconstruct video description from frame analyses and transcript."""
-        frame_notes = []
-        for i, (frame, analysis) in enumerate(zip(frames, frame_analyses)):
-            frame_note = (
-                f"Frame {i} ({frame.timestamp:.2f}s):\n"
-                f"{analysis.get('response', 'No analysis available')}"
-            )
-            frame_notes.append(frame_note)
-        
-        analysis_text = "\n\n".join(frame_notes)
+        """Reconstruct video description from frame analyses and transcript.
+
+        If the prompt would exceed reconstruction_tokens, the frame notes are first summarized in
+        chunks (see _summarize_chunks) and the description is written from those summaries.
+        """
+        frame_notes = self._frame_note_items(frame_analyses, frames)
+        analysis_text = "\n\n".join(text for text, _, _ in frame_notes)
         
         # Get first frame analysis
         first_frame_text = ""
@@ -104,11 +373,15 @@ class VideoAnalyzer:
         if transcript and transcript.text.strip():
             transcript_text = transcript.text
         
-        # Replace tokens in the prompt template
-        prompt = self.video_prompt.replace("{prompt}", self._format_user_prompt())
-        prompt = prompt.replace("{FRAME_NOTES}", analysis_text)
-        prompt = prompt.replace("{FIRST_FRAME}", first_frame_text)
-        prompt = prompt.replace("{TRANSCRIPT}", transcript_text)
+        prompt = self._reconstruction_prompt(analysis_text, first_frame_text, transcript_text)
+        prompt_tokens = estimate_tokens(prompt)
+        if (self.chunk_prompt and self.reconstruction_tokens and prompt_tokens > self.reconstruction_tokens
+                and len(frame_notes) > self.chunk_frames):
+            logger.info(f"Reconstruction prompt of ~{prompt_tokens} tokens exceeds {self.reconstruction_tokens}, "
+                        f"summarizing {len(frame_notes)} frames in chunks of {self.chunk_frames}")
+            parts = self._summarize_chunks(frame_notes, transcript)
+            # The transcript went into the chunk summaries along with the frames it belongs to
+            prompt = self._reconstruction_prompt("\n\n".join(text for text, _, _ in parts), first_frame_text, "")
         
         try:
             response = self.client.generate(
@@ -122,3 +395,77 @@ class VideoAnalyzer:
         except Exception as e:
             logger.error(f"Error reconstructing video: {e}")
             return {"response": f"Error reconstructing video: {str(e)}"}
+
+    def _reconstruction_prompt(self, frame_notes: str, first_frame: str, transcript: str) -> str:
+        """Fill the video reconstruction prompt template."""
+        # Replace tokens in the prompt template
+        prompt = self.video_prompt.replace("{prompt}", self._format_user_prompt())
+        prompt = prompt.replace("{FRAME_NOTES}", frame_notes)
+        prompt = prompt.replace("{FIRST_FRAME}", first_frame)
+        prompt = prompt.replace("{TRANSCRIPT}", transcript)
+        return prompt
+
+    def _frame_note_items(self, frame_analyses: List[Dict[str, Any]], frames: List[Frame]) -> List[Tuple[str, float, float]]:
+        """Each frame's note with the time range it covers: until the next frame."""
+        items = []
+        count = min(len(frames), len(frame_analyses))
+        for i, (frame, analysis) in enumerate(zip(frames, frame_analyses)):
+            frame_note = (
+                f"Frame {i} ({frame.timestamp:.2f}s):\n"
+                f"{analysis.get('response', 'No analysis available')}"
+            )
+            end = frames[i + 1].timestamp if i + 1 < count else frame.timestamp
+            items.append((frame_note, frame.timestamp, end))
+        return items
+
+    def _summarize_chunks(self, items: List[Tuple[str, float, float]],
+                          transcript: Optional[AudioTranscript]) -> List[Tuple[str, float, float]]:
+        """Summarize notes in chunks of chunk_frames, level by level, until the summaries fit.
+
+        items are (note, start, end) in chronological order. The first level summarizes frame notes
+        together with the transcript segments spoken during each chunk; higher levels summarize the
+        summaries. Chunks of a level are summarized in parallel on chunk_workers threads.
+        """
+        segments = transcript.segments if transcript else []
+        level = 0
+        while True:
+            chunks = [items[i:i + self.chunk_frames] for i in range(0, len(items), self.chunk_frames)]
+            spoken = []
+            for i, chunk in enumerate(chunks):
+                # Speech before the first frame and after the last belongs to the first and last chunk
+                start = chunk[0][1] if i else float("-inf")
+                end = chunks[i + 1][0][1] if i + 1 < len(chunks) else float("inf")
+                spoken.append(" ".join(s["text"].strip() for s in segments if s["end"] > start and s["start"] < end))
+            with ThreadPoolExecutor(max_workers=self.chunk_workers) as executor:
+                summaries = list(executor.map(self._summarize_chunk, chunks, spoken))
+            level += 1
+            items = [
+                (f"Part {i + 1} ({chunk[0][1]:.2f}s-{chunk[-1][2]:.2f}s):\n{summary}", chunk[0][1], chunk[-1][2])
+                for i, (chunk, summary) in enumerate(zip(chunks, summaries))
+            ]
+            segments = []
+            self.stats["reconstruction_chunks"] = self.stats.get("reconstruction_chunks", 0) + len(chunks)
+            self.stats["reconstruction_levels"] = level
+            notes = "\n\n".join(text for text, _, _ in items)
+            if len(items) == 1 or estimate_tokens(notes) <= self.reconstruction_tokens:
+                return items
+
+    def _summarize_chunk(self, chunk: List[Tuple[str, float, float]], spoken: str) -> str:
+        """Summarize one chunk of notes. Falls back to the notes themselves if the request fails."""
+        notes = "\n\n".join(text for text, _, _ in chunk)
+        start, end = chunk[0][1], chunk[-1][2]
+        prompt = self.chunk_prompt.replace("{START}", f"{start:.2f}").replace("{END}", f"{end:.2f}")
+        prompt = prompt.replace("{FRAME_NOTES}", notes)
+        prompt = prompt.replace("{TRANSCRIPT}", spoken)
+        prompt = prompt.replace("{prompt}", self._format_user_prompt())
+        try:
+            response = self.client.generate(
+                prompt=prompt,
+                model=self.model,
+                temperature=self.temperature,
+                num_predict=500
+            )
+            return response.get("response", "").strip()
+        except Exception as e:
+            logger.error(f"Error summarizing notes from {start:.2f}s to {end:.2f}s: {e}")
+            return notes
@@ -1,20 +1,24 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 from pathlib import Path
 import json
 import logging
 import shutil
 import sys
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import torch
 import torch.backends.mps
 
-from .config import Config, get_client, get_model
-from .frame import VideoProcessor
+from .config import Config, get_client, get_image_budget, get_model
+from .frame import Frame, VideoProcessor
 from .prompt import PromptLoader
 from .analyzer import VideoAnalyzer
 from .audio_processor import AudioProcessor, AudioTranscript
+from .journal import Journal, JournalState
 from .clients.ollama import OllamaClient
 from .clients.generic_openai_api import GenericOpenAIAPIClient
+from .clients.cache import CachedClient
 
 # Initialize logger at module level
 logger = logging.getLogger(__name__)
@@ -45,18 +49,236 @@ def cleanup_files(output_dir: Path):
     except Exception as e:
         logger.error(f"Error during cleanup: {e}")
 
+def transcribe_audio(config: Config, video_path: Path, output_dir: Path) -> Optional[AudioTranscript]:
+    """Extract and transcribe the audio track. Returns None if there is no usable speech."""
+    # Initialize audio processor and extract transcript, the AudioProcessor accept following parameters that can be set in config.json:
+    # language (str): Language code for audio transcription (default: None)
+    # whisper_model (str): Whisper model size or path (default: "medium")
+    # device (str): Device to use for audio processing (default: "cpu")
+    logger.debug("Initializing audio processing...")
+    audio_processor = AudioProcessor(language=config.get("audio", {}).get("language", ""), 
+                                     model_size_or_path=config.get("audio", {}).get("whisper_model", "medium"),
+                                     device=config.get("audio", {}).get("device", "cpu"))
+    
+    logger.info("Extracting audio from video...")
+    try:
+        audio_path = audio_processor.extract_audio(video_path, output_dir)
+    except Exception as e:
+        logger.error(f"Error extracting audio: {e}")
+        audio_path = None
+    
+    if audio_path is None:
+        logger.debug("No audio found in video - skipping transcription")
+        return None
+
+    logger.info("Transcribing audio...")
+    transcript = audio_processor.transcribe(audio_path)
+    if transcript is None:
+        logger.warning("Could not generate reliable transcript. Proceeding with video analysis only.")
+    return transcript
+
+def create_video_processor(config: Config, video_path: Path, output_dir: Path, model: str) -> VideoProcessor:
+    """Create the frame processor from the frames and image budget configuration."""
+    frames_config = config.get("frames", {})
+    image_budget = get_image_budget(config)
+    return VideoProcessor(
+        video_path, 
+        output_dir / "frames", 
+        model,
+        decode_mode=frames_config.get("decode_mode", "grab"),
+        score_width=frames_config.get("score_width"),
+        workers=frames_config.get("workers", 1),
+        backend=frames_config.get("backend", "opencv"),
+        max_edge=image_budget.get("max_edge") or frames_config.get("max_edge"),
+        index_dir=output_dir / "score_index" if frames_config.get("score_index", True) else None,
+        index_reuse_finer=frames_config.get("score_index_reuse_finer", False),
+        # Frames only need to touch disk when the user wants to keep them
+        write_frames=bool(config.get("keep_frames")),
+        image_format=image_budget.get("format", "jpeg"),
+        image_quality=image_budget.get("quality"),
+        encode_workers=frames_config.get("encode_workers", 4),
+        dedup_distance=frames_config.get("dedup_distance"),
+        selection=frames_config.get("selection", "score"),
+        nms_window=frames_config.get("nms_window", 2.0),
+        bucket_quota=frames_config.get("bucket_quota", 1),
+        candidate_source=frames_config.get("candidates", "sampled"),
+        keyframe_neighbours=frames_config.get("keyframe_neighbours", 0),
+        budget=frames_config.get("budget", "fixed"),
+        min_per_minute=frames_config.get("min_per_minute", 1),
+        metric=frames_config.get("metric", "absdiff"),
+        score_batch_size=frames_config.get("score_batch", 16),
+        decode_ahead=frames_config.get("decode_ahead", 8),
+        crop=frames_config.get("crop"),
+        stream_ahead=frames_config.get("stream_ahead", 4)
+    )
+
 def create_client(config: Config):
     """Create the appropriate client based on configuration."""
     client_type = config.get("clients", {}).get("default", "ollama")
     client_config = get_client(config)
     
     if client_type == "ollama":
-        return OllamaClient(client_config["url"])
+        client = OllamaClient(client_config["url"])
     elif client_type == "openai_api":
-        return GenericOpenAIAPIClient(client_config["api_key"], client_config["api_url"])
+        client = GenericOpenAIAPIClient(client_config["api_key"], client_config["api_url"],
+                                        image_detail=get_image_budget(config).get("detail"))
     else:
         raise ValueError(f"Unknown client type: {client_type}")
 
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", True):
+        return client
+    cache_path = Path(cache_config.get("path") or Path(config.get("output_dir")) / "llm_cache.sqlite")
+    logger.debug(f"Caching LLM responses in {cache_path}")
+    return CachedClient(client, cache_path, max_bytes=int(cache_config.get("max_mb", 256) * 1024 * 1024))
+
+def create_analyzer(config: Config, client, model: str, prompt_loader: PromptLoader) -> VideoAnalyzer:
+    """Create the frame analyzer from the analysis configuration."""
+    analysis_config = config.get("analysis", {})
+    return VideoAnalyzer(
+        client, 
+        model, 
+        prompt_loader,
+        config.get("clients", {}).get("temperature", 0.2),
+        config.get("prompt", ""),
+        contact_sheet=analysis_config.get("contact_sheet", 0),
+        tile_edge=analysis_config.get("tile_edge", 512),
+        concurrency=analysis_config.get("concurrency", 1),
+        context=analysis_config.get("context", "all"),
+        context_frames=analysis_config.get("context_frames", 5),
+        context_tokens=analysis_config.get("context_tokens", 2000),
+        summary_interval=analysis_config.get("summary_interval", 10),
+        summary_model=analysis_config.get("summary_model"),
+        reconstruction_tokens=analysis_config.get("reconstruction_tokens", 12000),
+        chunk_frames=analysis_config.get("chunk_frames", 20),
+        chunk_workers=analysis_config.get("chunk_workers", 4)
+    )
+
+# Frame settings that only change how fast frames are extracted, not which frames are selected
+SPEED_ONLY_FRAME_SETTINGS = {"workers", "decode_mode", "encode_workers", "score_batch", "decode_ahead", "stream_ahead",
+                             "score_index", "score_index_reuse_finer", "start_stage", "max_frames"}
+# Analysis settings only used to reconstruct the video description
+RECONSTRUCTION_SETTINGS = {"reconstruction_tokens", "chunk_frames", "chunk_workers"}
+
+def _fingerprint(settings: Any) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def run_settings(config: Config, model: str, prompt_loader: PromptLoader, max_frames: int) -> Dict[str, str]:
+    """Fingerprints of the settings the results of each stage depend on, keyed by result.
+
+    A resumed run only reuses journaled results whose settings are unchanged.
+    """
+    frames_config = config.get("frames", {})
+    analysis_config = config.get("analysis", {})
+    prompt_names = {prompt.get("name") for prompt in prompt_loader.prompts}
+    frame_prompts = [prompt_loader.get_by_index(0)] + [
+        prompt_loader.get_by_name(name) for name in ("Contact Sheet", "Context Summary") if name in prompt_names
+    ]
+    return {
+        "transcript": _fingerprint(config.get("audio", {})),
+        "frames": _fingerprint({
+            "frames": {key: value for key, value in frames_config.items() if key not in SPEED_ONLY_FRAME_SETTINGS},
+            "image": get_image_budget(config),
+            "duration": config.get("duration"),
+            "max_frames": max_frames
+        }),
+        "analysis": _fingerprint({
+            "client": config.get("clients", {}).get("default"),
+            "model": model,
+            "temperature": config.get("clients", {}).get("temperature", 0.2),
+            "prompt": config.get("prompt", ""),
+            "frame_prompts": frame_prompts,
+            "analysis": {key: value for key, value in analysis_config.items() if key not in RECONSTRUCTION_SETTINGS},
+            "response_length": config.get("response_length", {}).get("frame")
+        })
+    }
+
+def reuse_journaled_results(state: JournalState, settings: Dict[str, str], reuse_analyses: bool) -> bool:
+    """Drop the journaled results that were produced with other settings than the current ones.
+
+    Args:
+        state: Results of the journaled run, changed in place
+        settings: Current settings fingerprints, from run_settings
+        reuse_analyses: Whether frame analyses may be reused at all (with --resume or --start-stage 3)
+
+    Returns:
+        True if any result was dropped
+    """
+    dropped = False
+    if state.transcript_recorded and state.settings.get("transcript") != settings["transcript"]:
+        logger.warning("Audio settings changed since the journaled run, transcribing again")
+        state.transcript_recorded = False
+        state.transcript = None
+        dropped = True
+    if (state.frames is not None or state.analyses) and state.settings.get("frames") != settings["frames"]:
+        logger.warning("Frame settings changed since the journaled run, extracting and analyzing frames again")
+        state.frames = None
+        state.drop_analyses()
+        dropped = True
+    if state.analyses and state.settings.get("analysis") != settings["analysis"]:
+        logger.warning("Model, prompt or analysis settings changed since the journaled run, analyzing frames again")
+        state.drop_analyses()
+        dropped = True
+    elif state.analyses and not reuse_analyses:
+        logger.info("Analyzing frames again; use --resume to reuse the journaled frame analyses")
+        state.drop_analyses()
+        dropped = True
+    return dropped
+
+def analyze_frames(analyzer: VideoAnalyzer, frames: Iterable[Frame], journal: Journal,
+                   state: Optional[JournalState]) -> Tuple[List[Frame], List[Dict[str, Any]]]:
+    """Analyze frames, journaling every analysis as it completes.
+
+    Frames with an analysis recorded by a previous run are not sent again. Each run of frames
+    without one is analyzed with the analyses of the frames before it as previous frames.
+    frames may be a stream that is still being extracted, also when resuming a streamed run.
+    """
+    def recorded(frame: Frame) -> Optional[Dict[str, Any]]:
+        return state.analysis_for(frame) if state is not None else None
+
+    remaining = iter(frames)
+    analyzed: List[Frame] = []
+    analyses: List[Dict[str, Any]] = []
+    reused = 0
+    summaries = dict(state.summaries) if state is not None else {}
+
+    def record_summary():
+        # Journal the rolling context summary whenever the analyzer folded more notes into it
+        if analyzer.summarized_frames and summaries.get(analyzer.summarized_frames) != analyzer.summary:
+            summaries[analyzer.summarized_frames] = analyzer.summary
+            journal.record_summary(analyzer.summarized_frames, analyzer.summary)
+    # The next frame not yet consumed, so a run of frames without analyses ends before it
+    pending = next(remaining, None)
+
+    def missing_run():
+        nonlocal pending
+        while pending is not None and recorded(pending) is None:
+            frame = pending
+            analyzed.append(frame)
+            yield frame
+            pending = next(remaining, None)
+
+    while pending is not None:
+        analysis = recorded(pending)
+        if analysis is not None:
+            analyzed.append(pending)
+            analyses.append(analysis)
+            reused += 1
+            pending = next(remaining, None)
+            continue
+        if analyses:
+            # Continue from the latest summary of frames before this run
+            folded = max((frames for frames in summaries if frames <= len(analyses)), default=0)
+            analyzer.restore_previous_analyses(analyses, summaries.get(folded, ""), folded)
+            record_summary()
+        for analysis in analyzer.analyze_frames(missing_run()):
+            journal.record_analysis(analyzed[len(analyses)], analysis)
+            analyses.append(analysis)
+            record_summary()
+    if reused:
+        logger.info(f"Reused {reused} of {len(analyzed)} frame analyses from {journal.path}")
+    return analyzed, analyses
+
 def main():
     parser = argparse.ArgumentParser(description="Analyze video using Vision models")
     parser.add_argument("video_path", type=str, help="Path to the video file")
@@ -71,7 +293,10 @@ def main():
     parser.add_argument("--duration", type=float, help="Duration in seconds to process")
     parser.add_argument("--keep-frames", action="store_true", help="Keep extracted frames after analysis")
     parser.add_argument("--whisper-model", type=str, help="Whisper model size (tiny, base, small, medium, large), or path to local Whisper model snapshot")
-    parser.add_argument("--start-stage", type=int, default=1, help="Stage to start processing from (1-3)")
+    parser.add_argument("--start-stage", type=int, default=1,
+                        help="Stage to start processing from (1-3), using the earlier stages' results from the journal and redoing this one")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its journal, only processing missing work")
     parser.add_argument("--max-frames", type=int, default=sys.maxsize, help="Maximum number of frames to process")
     parser.add_argument("--log-level", type=str, default="INFO", 
                         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
@@ -81,6 +306,9 @@ def main():
     parser.add_argument("--language", type=str, default=None)
     parser.add_argument("--device", type=str, default="cpu")
     parser.add_argument("--temperature", type=float, help="Temperature for LLM generation")
+    parser.add_argument("--no-cache", action="store_true", help="Send every LLM request instead of reusing cached responses")
+    parser.add_argument("--concurrency", type=int,
+                        help="Number of frame analysis requests in flight at once (frames are then analyzed independently)")
     args = parser.parse_args()
 
     # Set up logging with specified level
@@ -104,73 +332,138 @@ def main():
     client = create_client(config)
     model = get_model(config)
     prompt_loader = PromptLoader(config.get("prompt_dir"), config.get("prompts", []))
+
+    # Every finished step is journaled so an interrupted run can be resumed
+    journal = Journal(output_dir / "journal.jsonl")
+    settings = run_settings(config, model, prompt_loader, args.max_frames)
+    state = None
+    if args.resume or args.start_stage > 1:
+        state = journal.load()
+        if state is None:
+            logger.warning(f"No journal found at {journal.path}, starting from stage 1")
+        elif state.video != str(video_path):
+            logger.warning(f"Journal {journal.path} belongs to {state.video}, starting from stage 1")
+            state = None
+    if state is None:
+        start_stage = 1
+        journal.start(video_path, model, settings)
+    else:
+        # Results of the stage to start from are only reused when resuming
+        dropped = reuse_journaled_results(state, settings, reuse_analyses=args.resume or args.start_stage > 2)
+        start_stage = args.start_stage
+        if start_stage > 2 and (state.frames is None or not state.analyses):
+            logger.warning("The journal has no frame analyses to reconstruct the video from, starting from stage 2")
+            start_stage = 2
+        if dropped or state.settings != settings:
+            # The journal must only hold results of the current settings; keep the reusable ones
+            journal.start(video_path, model, settings, carry_over=state)
+        else:
+            journal.reopen()
+        logger.info(f"Resuming from {journal.path} ({len(state.analyses)} frame analyses reused)")
     
     try:
         transcript = None
-        frames = []
+        frames = state.frames if state is not None and state.frames is not None else []
         frame_analyses = []
         video_description = None
+        frame_stats = {}
+        request_stats = {}
+        reconstruction_stats = {}
+        frame_source = None
+        transcript_future = None
+        analyzer = create_analyzer(config, client, model, prompt_loader)
+
+        # Frames still to be analyzed have to be on disk; frames kept in memory are extracted again
+        need_frames = start_stage <= 2 and (
+            state is None or state.frames is None or any(
+                state.analysis_for(frame) is None and (frame.path is None or not frame.path.exists())
+                for frame in state.frames
+            )
+        )
+        need_transcript = state is None or not state.transcript_recorded
+        if not need_transcript:
+            transcript = state.transcript
+        if start_stage > 1 and (need_frames or need_transcript):
+            logger.info("The journal lacks some stage 1 results, extracting them again")
         
         # Stage 1: Frame and Audio Processing
-        if args.start_stage <= 1:
-            # Initialize audio processor and extract transcript, the AudioProcessor accept following parameters that can be set in config.json:
-            # language (str): Language code for audio transcription (default: None)
-            # whisper_model (str): Whisper model size or path (default: "medium")
-            # device (str): Device to use for audio processing (default: "cpu")
-            logger.debug("Initializing audio processing...")
-            audio_processor = AudioProcessor(language=config.get("audio", {}).get("language", ""), 
-                                             model_size_or_path=config.get("audio", {}).get("whisper_model", "medium"),
-                                             device=config.get("audio", {}).get("device", "cpu"))
+        if need_frames or need_transcript:
+            # A run that streamed its frames records the frame list only after stage 2, so it is
+            # resumed by streaming the same frames again; a recorded frame list is extracted again
+            # the way it was selected
+            streaming = (config.get("frames", {}).get("streaming", False) and need_frames
+                         and (state is None or state.frames is None))
+            if need_transcript:
+                if streaming:
+                    # Frames are analyzed while they are decoded; transcription runs alongside and is
+                    # only needed for stage 3
+                    audio_executor = ThreadPoolExecutor(max_workers=1)
+                    transcript_future = audio_executor.submit(transcribe_audio, config, video_path, output_dir)
+                    audio_executor.shutdown(wait=False)
+                else:
+                    transcript = transcribe_audio(config, video_path, output_dir)
+                    journal.record_transcript(transcript)
             
-            logger.info("Extracting audio from video...")
-            try:
-                audio_path = audio_processor.extract_audio(video_path, output_dir)
-            except Exception as e:
-                logger.error(f"Error extracting audio: {e}")
-                audio_path = None
-            
-            if audio_path is None:
-                logger.debug("No audio found in video - skipping transcription")
-                transcript = None
-            else:
-                logger.info("Transcribing audio...")
-                transcript = audio_processor.transcribe(audio_path)
-                if transcript is None:
-                    logger.warning("Could not generate reliable transcript. Proceeding with video analysis only.")
-            
-            logger.info(f"Extracting frames from video using model {model}...")
-            processor = VideoProcessor(
-                video_path, 
-                output_dir / "frames", 
-                model
-            )
-            frames = processor.extract_keyframes(
-                frames_per_minute=config.get("frames", {}).get("per_minute", 60),
-                duration=config.get("duration"),
-                max_frames=args.max_frames
-            )
+            if need_frames:
+                logger.info(f"Extracting frames from video using model {model}...")
+                processor = create_video_processor(config, video_path, output_dir, model)
+                frame_kwargs = {
+                    "frames_per_minute": config.get("frames", {}).get("per_minute", 60),
+                    "duration": config.get("duration"),
+                    "max_frames": args.max_frames
+                }
+                if streaming:
+                    frame_source = processor.iter_keyframes(**frame_kwargs)
+                else:
+                    frames = processor.extract_keyframes(**frame_kwargs)
+                    journal.record_frames(frames)
+                frame_stats = processor.stats
             
         # Stage 2: Frame Analysis
-        if args.start_stage <= 2:
+        if start_stage <= 2:
             logger.info("Analyzing frames...")
-            analyzer = VideoAnalyzer(
-                client, 
-                model, 
-                prompt_loader,
-                config.get("clients", {}).get("temperature", 0.2),
-                config.get("prompt", "")
-            )
-            frame_analyses = []
-            for frame in frames:
-                analysis = analyzer.analyze_frame(frame)
-                frame_analyses.append(analysis)
+            frames, frame_analyses = analyze_frames(analyzer, frame_source if frame_source is not None else frames,
+                                                    journal, state)
+            if frame_source is not None:
+                journal.record_frames(frames)
+            if transcript_future is not None:
+                transcript = transcript_future.result()
+                journal.record_transcript(transcript)
+            request_stats = dict(analyzer.stats)
+            if request_stats["frame_requests"]:
+                request_stats["mean_frame_request_seconds"] = (
+                    request_stats["frame_request_seconds"] / request_stats["frame_requests"]
+                )
+                logger.info(
+                    f"Analyzed {len(frame_analyses)} frames in {request_stats['frame_requests']} requests: "
+                    f"{request_stats['frame_payload_bytes'] / request_stats['frame_requests'] / 1024:.0f} KB/request, "
+                    f"{request_stats['mean_frame_request_seconds']:.2f}s/request"
+                )
+            prompt_tokens = request_stats["frame_prompt_tokens"]
+            if prompt_tokens:
+                request_stats["total_frame_prompt_tokens"] = sum(prompt_tokens)
+                logger.info(
+                    f"Frame prompts: ~{sum(prompt_tokens)} tokens in total, ~{max(prompt_tokens)} at most per request "
+                    f"(context policy: {analyzer.context})"
+                )
+        else:
+            recorded = [(frame, state.analysis_for(frame)) for frame in frames]
+            missing = sum(analysis is None for _, analysis in recorded)
+            if missing:
+                logger.warning(f"{missing} of {len(frames)} frames have no analysis in the journal; "
+                               f"run with --resume to analyze them")
+            frames = [frame for frame, analysis in recorded if analysis is not None]
+            frame_analyses = [analysis for _, analysis in recorded if analysis is not None]
                 
         # Stage 3: Video Reconstruction
-        if args.start_stage <= 3:
+        if start_stage <= 3:
             logger.info("Reconstructing video description...")
             video_description = analyzer.reconstruct_video(
                 frame_analyses, frames, transcript
             )
+            reconstruction_stats = {
+                key: value for key, value in analyzer.stats.items() if key.startswith("reconstruction_")
+            }
         
         output_dir.mkdir(parents=True, exist_ok=True)
         results = {
@@ -184,7 +477,11 @@ def main():
                 "frames_processed": min(len(frames), args.max_frames),
                 "start_stage": args.start_stage,
                 "audio_language": transcript.language if transcript else None,
-                "transcription_successful": transcript is not None
+                "transcription_successful": transcript is not None,
+                "frame_extraction": frame_stats,
+                "frame_requests": request_stats,
+                "reconstruction": reconstruction_stats,
+                "llm_cache": client.stats() if isinstance(client, CachedClient) else None
             },
             "transcript": {
                 "text": transcript.text if transcript else None,
@@ -210,13 +507,22 @@ def main():
         if not config.get("keep_frames"):
             cleanup_files(output_dir)
         
+        if isinstance(client, CachedClient):
+            cache_stats = client.stats()
+            logger.info(f"LLM response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+            client.close()
+        if frame_stats.get("near_duplicates_suppressed"):
+            logger.info(f"Near-duplicate suppression saved {frame_stats['near_duplicates_suppressed']} frame analysis calls")
         logger.info(f"Analysis complete. Results saved to {output_dir / 'analysis.json'}")
             
     except Exception as e:
         logger.error(f"Error during video analysis: {e}")
         if not config.get("keep_frames"):
             cleanup_files(output_dir)
+        logger.info(f"Completed work is recorded in {journal.path}; rerun with --resume to continue")
         raise
+    finally:
+        journal.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+from .llm_client import LLMClient
+
+logger = logging.getLogger(__name__)
+
+# Requests that update a cached entry's last use between commits
+TOUCH_BATCH = 32
+
+class CachedClient(LLMClient):
+    """LLM client that answers repeated requests from a SQLite cache on disk.
+
+    Responses are keyed by the model, the fully rendered prompt, a SHA-256 of the image,
+    temperature and num_predict, so any change to a prompt or frame is a miss. When the cached
+    responses exceed max_bytes the least recently used ones are evicted. Failed requests are
+    not cached.
+    """
+
+    def __init__(self, client: LLMClient, path: Path, max_bytes: int = 256 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            client: Client that answers cache misses
+            path: SQLite database file, created if missing
+            max_bytes: Total size of cached responses above which the least recently used are evicted
+        """
+        self.client = client
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Frame requests may run on several threads; they share one connection
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+        self._pending_touches = 0
+
+    def cache_key(self, prompt: str, image_path: Optional[str], image_bytes: Optional[bytes], model: str,
+                  temperature: float, num_predict: int) -> str:
+        """Content-addressed key of one request."""
+        if image_bytes is None and image_path:
+            image_bytes = Path(image_path).read_bytes()
+        request = {
+            "model": model,
+            "prompt": prompt,
+            "image": hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else None,
+            "temperature": temperature,
+            "num_predict": num_predict
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def generate(self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        stream: bool = False,
+        model: str = "llama3.2-vision",
+        temperature: float = 0.2,
+        num_predict: int = 256,
+        image_bytes: Optional[bytes] = None) -> Dict[Any, Any]:
+        key = self.cache_key(prompt, image_path, image_bytes, model, temperature, num_predict)
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._pending_touches += 1
+                if self._pending_touches >= TOUCH_BATCH:
+                    self._db.commit()
+                    self._pending_touches = 0
+                return json.loads(row[0])
+            self.misses += 1
+
+        # Requests are sent outside the lock so concurrent misses overlap
+        response = self.client.generate(prompt=prompt, image_path=image_path, stream=stream, model=model,
+                                        temperature=temperature, num_predict=num_predict, image_bytes=image_bytes)
+        stored = json.dumps({k: v for k, v in response.items() if k != "context"})
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, stored, len(stored), time.time())
+            )
+            self._evict()
+            self._db.commit()
+            self._pending_touches = 0
+        return response
+
+    def _evict(self) -> None:
+        """Delete the least recently used responses until the cache fits in max_bytes."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.evictions += evicted
+        logger.debug(f"Evicted {evicted} cached responses to stay under {self.max_bytes / (1024 * 1024):.0f} MB")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counts since the cache was opened."""
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
@@ -14,11 +14,21 @@ RATE_LIMIT_WAIT_TIME = 25  # seconds
 DEFAULT_WAIT_TIME = 25  # seconds
 
 class GenericOpenAIAPIClient(LLMClient):
-    def __init__(self, api_key: str, api_url: str, max_retries: int = DEFAULT_MAX_RETRIES):
+    def __init__(self, api_key: str, api_url: str, max_retries: int = DEFAULT_MAX_RETRIES,
+                 image_detail: Optional[str] = None):
+        """Initialize the client.
+
+        Args:
+            api_key: API key for the service
+            api_url: Base URL of the OpenAI-compatible API
+            max_retries: Number of attempts per request
+            image_detail: Optional "detail" hint sent with images ("low", "high" or "auto")
+        """
         self.api_key = api_key
         self.base_url = api_url.rstrip('/')  # Remove trailing slash if present
         self.generate_url = f"{self.base_url}/chat/completions"
         self.max_retries = max_retries
+        self.image_detail = image_detail
 
     def generate(self,
         prompt: str,
@@ -26,16 +36,21 @@ class GenericOpenAIAPIClient(LLMClient):
         stream: bool = False,
         model: str = "llama3.2-vision",
         temperature: float = 0.2,
-        num_predict: int = 256) -> Dict[Any, Any]:
+        num_predict: int = 256,
+        image_bytes: Optional[bytes] = None) -> Dict[Any, Any]:
         """Generate response from OpenAI-compatible API."""
         # Prepare request content
-        if image_path:
-            base64_image = self.encode_image(image_path)
+        if image_path or image_bytes is not None:
+            base64_image = self._encode_request_image(image_path, image_bytes)
+            mime_type = self.image_mime_type(image_path, image_bytes)
+            image_url = {"url": f"data:{mime_type};base64,{base64_image}"}
+            if self.image_detail:
+                image_url["detail"] = self.image_detail
             content = [
                 {"type": "text", "text": prompt},
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                    "image_url": image_url
                 }
             ]
         else:
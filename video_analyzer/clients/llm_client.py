@@ -1,12 +1,35 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any
 import base64
+from pathlib import Path
 
 class LLMClient(ABC):
     def encode_image(self, image_path: str) -> str:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
+    def encode_image_bytes(self, image_bytes: bytes) -> str:
+        return base64.b64encode(image_bytes).decode('utf-8')
+
+    def image_mime_type(self, image_path: Optional[str] = None, image_bytes: Optional[bytes] = None) -> str:
+        """Guess the MIME type of the request image from its bytes or file extension."""
+        if image_bytes is not None:
+            if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+                return "image/webp"
+            if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+                return "image/png"
+            return "image/jpeg"
+        suffix = Path(image_path).suffix.lower() if image_path else ""
+        return {".webp": "image/webp", ".png": "image/png"}.get(suffix, "image/jpeg")
+
+    def _encode_request_image(self, image_path: Optional[str] = None, image_bytes: Optional[bytes] = None) -> Optional[str]:
+        """Base64-encode the request image, preferring in-memory bytes over a file on disk."""
+        if image_bytes is not None:
+            return self.encode_image_bytes(image_bytes)
+        if image_path:
+            return self.encode_image(image_path)
+        return None
+
     @abstractmethod
     def generate(self,
         prompt: str,
@@ -14,5 +37,6 @@ class LLMClient(ABC):
         stream: bool = False,
         model: str = "llama3.2-vision",
         temperature: float = 0.2,
-        num_predict: int = 256) -> Dict[Any, Any]:
+        num_predict: int = 256,
+        image_bytes: Optional[bytes] = None) -> Dict[Any, Any]:
         pass
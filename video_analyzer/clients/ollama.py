@@ -14,7 +14,8 @@ class OllamaClient(LLMClient):
         stream: bool = False,
         model: str = "llama3.2-vision",
         temperature: float = 0.2,
-        num_predict: int = 256) -> Dict[Any, Any]:
+        num_predict: int = 256,
+        image_bytes: Optional[bytes] = None) -> Dict[Any, Any]:
         try:
             # Build the request data
             data = {
@@ -27,9 +28,9 @@ class OllamaClient(LLMClient):
                 }
             }
             
-            if image_path:
-                # Use encode_image from parent LLMClient class
-                data["images"] = [self.encode_image(image_path)]
+            if image_path or image_bytes is not None:
+                # Use the image encoding from parent LLMClient class
+                data["images"] = [self._encode_request_image(image_path, image_bytes)]
                     
             response = requests.post(self.generate_url, json=data)
             response.raise_for_status()
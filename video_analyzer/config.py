@@ -86,7 +86,12 @@ class Config:
                     self.config["audio"]["device"] = value
                 elif key == "temperature":
                     self.config["clients"]["temperature"] = value
-                elif key not in ["start_stage", "max_frames"]:  # Ignore these as they're command-line only
+                elif key == "no_cache":
+                    if value:
+                        self.config.setdefault("cache", {})["enabled"] = False
+                elif key == "concurrency":
+                    self.config.setdefault("analysis", {})["concurrency"] = value
+                elif key not in ["start_stage", "max_frames", "resume"]:  # Ignore these as they're command-line only
                     self.config[key] = value
 
     def save_user_config(self):
@@ -126,3 +131,16 @@ def get_model(config: Config) -> str:
     client_type = config.get("clients", {}).get("default", "ollama")
     client_config = config.get("clients", {}).get(client_type, {})
     return client_config.get("model", "llama3.2-vision")
+
+def get_image_budget(config: Config) -> dict:
+    """Get the image budget frames are prepared with for the configured client and model.
+
+    Settings come from clients.<client>.image, overridden per model by
+    clients.<client>.model_images.<model>. Recognized keys are max_edge, format, quality and
+    detail; missing keys are left to the frame processor and client defaults.
+    """
+    client_type = config.get("clients", {}).get("default", "ollama")
+    client_config = config.get("clients", {}).get(client_type, {})
+    budget = dict(client_config.get("image") or {})
+    budget.update(client_config.get("model_images", {}).get(get_model(config)) or {})
+    return budget
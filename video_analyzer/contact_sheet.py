@@ -0,0 +1,89 @@
+import logging
+import math
+import re
+from typing import List, Optional
+import cv2
+import numpy as np
+from .frame import Frame
+
+logger = logging.getLogger(__name__)
+
+# Height of the label bar drawn above every tile
+LABEL_HEIGHT = 28
+# Gap between tiles and around the sheet
+TILE_GAP = 4
+
+# A tile's notes start at a line beginning with "Frame 3", "Tile 3" or "[3]" (optionally in markdown)
+_TILE_HEADER = re.compile(r"^[\s*#>_-]*(?:(?:frame|tile)\s*#?\s*(\d+)|\[(\d+)\])", re.IGNORECASE | re.MULTILINE)
+# Responses without such headers may number the tiles as a plain list: "3." or "3)"
+_NUMBERED_HEADER = re.compile(r"^[\s*#>_-]*(\d+)[.)]", re.MULTILINE)
+
+def load_frame_image(frame: Frame) -> np.ndarray:
+    """Decode a frame's encoded image, from memory or from disk."""
+    if frame.image is not None:
+        image = cv2.imdecode(np.frombuffer(frame.image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    elif frame.path is not None:
+        image = cv2.imread(str(frame.path), cv2.IMREAD_COLOR)
+    else:
+        image = None
+    if image is None:
+        raise ValueError(f"Could not load image of frame {frame.number}")
+    return image
+
+def build_contact_sheet(frames: List[Frame], tile_edge: int = 512, columns: Optional[int] = None,
+                        quality: int = 85) -> bytes:
+    """Tile frames into one labelled grid image and return it JPEG-encoded.
+
+    Each tile is scaled so its longest edge is tile_edge and gets a label bar with its tile number
+    (1-based, in frame order) and timestamp burned in, so the model can refer to tiles by number.
+
+    Args:
+        frames: Frames to tile, in chronological order
+        tile_edge: Longest edge of each tile in pixels
+        columns: Tiles per row. None picks a near-square grid
+        quality: JPEG quality of the sheet
+    """
+    images = [load_frame_image(frame) for frame in frames]
+    columns = columns or math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+
+    height, width = images[0].shape[:2]
+    scale = tile_edge / max(width, height)
+    tile_width, tile_height = max(1, round(width * scale)), max(1, round(height * scale))
+    cell_height = tile_height + LABEL_HEIGHT
+
+    sheet = np.full((rows * (cell_height + TILE_GAP) + TILE_GAP, columns * (tile_width + TILE_GAP) + TILE_GAP, 3),
+                    255, dtype=np.uint8)
+    for i, (frame, image) in enumerate(zip(frames, images)):
+        row, column = divmod(i, columns)
+        top = TILE_GAP + row * (cell_height + TILE_GAP)
+        left = TILE_GAP + column * (tile_width + TILE_GAP)
+        sheet[top:top + LABEL_HEIGHT, left:left + tile_width] = 0
+        cv2.putText(sheet, f"Frame {i + 1}  {frame.timestamp:.2f}s", (left + 6, top + LABEL_HEIGHT - 8),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+        sheet[top + LABEL_HEIGHT:top + cell_height, left:left + tile_width] = cv2.resize(
+            image, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode(".jpg", sheet, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Could not encode contact sheet")
+    return encoded.tobytes()
+
+def split_sheet_response(response: str, count: int) -> List[Optional[str]]:
+    """Split a contact sheet response into the notes of each of its count tiles.
+
+    Notes are expected to start with a "Frame N" header per tile. Numbered list lines ("1.") are
+    only taken as tile headers when the response has no such headers, since the notes of a tile
+    are often themselves a numbered list. Returns one entry per tile, None for tiles the response
+    has no notes for.
+    """
+    notes: List[Optional[str]] = [None] * count
+    matches = list(_TILE_HEADER.finditer(response)) or list(_NUMBERED_HEADER.finditer(response))
+    headers = [(match, int(next(group for group in match.groups() if group))) for match in matches]
+    headers = [(match, number) for match, number in headers if 1 <= number <= count]
+    for i, (match, number) in enumerate(headers):
+        end = headers[i + 1][0].start() if i + 1 < len(headers) else len(response)
+        text = response[match.end():end].strip().lstrip(":*-– ").strip()
+        if text:
+            notes[number - 1] = f"{notes[number - 1]}\n{text}" if notes[number - 1] else text
+    return notes
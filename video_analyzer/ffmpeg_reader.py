@@ -0,0 +1,134 @@
+import logging
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def has_ffmpeg() -> bool:
+    """Check whether the ffmpeg binary is available on PATH."""
+    return shutil.which("ffmpeg") is not None
+
+def has_ffprobe() -> bool:
+    """Check whether the ffprobe binary is available on PATH."""
+    return shutil.which("ffprobe") is not None
+
+def _keyframe_times_ffprobe(video_path: Path) -> List[float]:
+    """Presentation times of the keyframe packets of the first video stream, read without decoding."""
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,flags",
+        "-of", "csv=p=0",
+        str(video_path)
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stdout.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 3 or "K" not in fields[2]:
+            continue
+        time = fields[0] if fields[0] not in ("", "N/A") else fields[1]
+        if time not in ("", "N/A"):
+            times.append(float(time))
+    return times
+
+def _keyframe_times_ffmpeg(video_path: Path) -> List[float]:
+    """Presentation times of the keyframes of the first video stream, decoding nothing but keyframes."""
+    command = [
+        "ffmpeg", "-v", "info", "-nostdin",
+        "-skip_frame", "nokey",
+        "-i", str(video_path),
+        "-map", "0:v:0",
+        "-an",
+        "-vf", "showinfo",
+        "-vsync", "0",
+        "-f", "null",
+        "-"
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return [float(match) for match in re.findall(r"\bpts_time:(-?[0-9.]+)", result.stderr)]
+
+def probe_keyframes(video_path: Path, fps: float) -> Optional[List[int]]:
+    """Frame numbers of the keyframes (I-frames) of a video, in ascending order.
+
+    The container's packet index is read with ffprobe when it is installed. Otherwise ffmpeg
+    decodes only the keyframes (-skip_frame nokey) to report their timestamps. Returns None if
+    neither tool is available or probing fails.
+    """
+    try:
+        if has_ffprobe():
+            times = _keyframe_times_ffprobe(video_path)
+        elif has_ffmpeg():
+            times = _keyframe_times_ffmpeg(video_path)
+        else:
+            return None
+    except (subprocess.CalledProcessError, ValueError) as e:
+        logger.warning(f"Could not read keyframe index of {video_path}: {e}")
+        return None
+    if not times:
+        return None
+    # Frame numbers count from the start of the stream, whatever its first timestamp
+    start = min(times)
+    return sorted({round((time - start) * fps) for time in times})
+
+def _read_exact(stream, buffer: memoryview) -> bool:
+    """Fill buffer from stream. Returns False if the stream ended first."""
+    filled = 0
+    while filled < len(buffer):
+        count = stream.readinto(buffer[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+def iter_ffmpeg_frames(video_path: Path, start: int, end: int, sample_interval: int, fps: float,
+                       output_size: Tuple[int, int], source_size: Optional[Tuple[int, int]] = None,
+                       buffers: Optional[Iterator[np.ndarray]] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (frame_number, frame) for every sampled frame in [start, end) from an ffmpeg rawvideo pipe.
+
+    Decimation (one frame in every sample_interval) and scaling to output_size happen inside the
+    ffmpeg filter graph, so only sampled frames reach Python, already at their final size, as BGR
+    arrays. start must be a multiple of sample_interval. When buffers is given, frames are read
+    into its (height, width, 3) uint8 arrays instead of newly allocated ones.
+    """
+    width, height = output_size
+    filters = [f"select='not(mod(n\\,{sample_interval}))'"]
+    if source_size is None or tuple(source_size) != (width, height):
+        filters.append(f"scale={width}:{height}:flags=area")
+
+    num_samples = -(-(end - start) // sample_interval)
+    command = ["ffmpeg", "-v", "error", "-nostdin"]
+    if start > 0:
+        # Accurate input seek: ffmpeg decodes from the preceding keyframe and resumes output at
+        # the frame nearest to this timestamp, which becomes n == 0 for the select filter
+        command += ["-ss", f"{start / fps:.6f}"]
+    command += [
+        "-i", str(video_path),
+        "-map", "0:v:0",
+        "-an",
+        "-vf", ",".join(filters),
+        "-vsync", "0",  # One output frame per selected input frame
+        "-frames:v", str(num_samples),
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "-"
+    ]
+    logger.debug(f"Running {' '.join(command)}")
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=width * height * 3)
+    try:
+        for frame_count in range(start, end, sample_interval):
+            frame = np.empty((height, width, 3), dtype=np.uint8) if buffers is None else next(buffers, None)
+            if frame is None or not _read_exact(process.stdout, memoryview(frame).cast("B")):
+                break
+            yield frame_count, frame
+    finally:
+        process.stdout.close()
+        process.kill()
+        _, stderr = process.communicate()
+        if process.returncode not in (0, -9) and stderr:
+            logger.warning(f"FFmpeg error: {stderr.decode(errors='replace').strip()}")
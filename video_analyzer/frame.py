@@ -1,43 +1,214 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import cv2
 import numpy as np
 import logging
+from .ffmpeg_reader import has_ffmpeg, iter_ffmpeg_frames, probe_keyframes
+from .frame_region import ActivityMap, crop_pixels
+from .frame_ring import FrameRing, read_ahead
+from .frame_scoring import dhash, hamming_distance, metric_weights, score_batch, to_score_thumbnail
+from .frame_selection import allocate_budget, BucketCandidates, BucketSelector, Candidate, Candidates, TopKCandidates, sample_evenly
+from .score_index import ScoreIndex, ScoreIndexStore, video_content_hash
 
 logger = logging.getLogger(__name__)
 
 @dataclass
 class Frame:
     number: int
-    path: Path
+    path: Optional[Path]
     timestamp: float
     score: float
+    image: Optional[bytes] = None  # Encoded JPEG, set when frames are kept in memory instead of on disk
+
+@dataclass
+class SegmentScan:
+    """Result of decoding and scoring one time range of a video."""
+    candidates: List[Candidate]  # Best candidates, most significant first
+    frame_numbers: List[int]  # Every sampled frame ...
+    scores: List[float]  # ... and its score
+    suppressed: int  # Near-duplicates suppressed
+    suppressed_in_window: int  # Frames suppressed by the NMS window
+    ring_stats: Dict[str, float]  # Decode ring statistics, empty without a ring
+    activity: Optional[ActivityMap]  # Where the frame changes, when cropping is enabled
 
 class VideoProcessor:
     # Class constants
     FRAME_DIFFERENCE_THRESHOLD = 10.0
+    DECODE_MODES = ("grab", "seek", "read")
+    BACKENDS = ("opencv", "ffmpeg")
+    IMAGE_FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+    SELECTION_STRATEGIES = ("score", "nms", "bucket")
+    CANDIDATE_SOURCES = ("sampled", "keyframes")
+    BUDGET_MODES = ("fixed", "adaptive")
+    CROP_MODES = ("letterbox", "active")
     
-    def __init__(self, video_path: Path, output_dir: Path, model: str):
+    def __init__(self, video_path: Path, output_dir: Path, model: str, decode_mode: str = "grab",
+                 score_width: Optional[int] = None, workers: int = 1, backend: str = "opencv",
+                 max_edge: Optional[int] = None, index_dir: Optional[Path] = None, write_frames: bool = True,
+                 image_format: str = "jpeg", image_quality: Optional[int] = None, encode_workers: int = 4,
+                 dedup_distance: Optional[int] = None, selection: str = "score", nms_window: float = 2.0,
+                 bucket_quota: int = 1, candidate_source: str = "sampled", keyframe_neighbours: int = 0,
+                 budget: str = "fixed", min_per_minute: int = 1, metric: Union[str, Dict[str, float]] = "absdiff",
+                 score_batch_size: int = 16, decode_ahead: int = 8, crop: Optional[str] = None,
+                 index_reuse_finer: bool = False, stream_ahead: int = 4):
+        """Initialize the VideoProcessor.
+
+        Args:
+            video_path: Path to the video file
+            output_dir: Directory the selected frames are written to
+            model: Name of the vision model the frames are extracted for
+            decode_mode: How frames between samples are skipped. "grab" demuxes them without
+                        converting to BGR, "seek" jumps straight to each sampled frame (fastest for
+                        large sampling intervals on files with frequent keyframes) and "read"
+                        fully decodes every frame
+            score_width: Width of the grayscale thumbnail frame differences are computed on.
+                        None scores at the source resolution
+            workers: Number of processes the video is split across for decoding and scoring.
+                    Each process scans its own time range with its own capture
+            backend: "opencv" decodes with cv2.VideoCapture. "ffmpeg" reads sampled frames from an
+                    ffmpeg rawvideo pipe with decimation and scaling done inside the decoder
+            max_edge: Downscale selected frames so their longest edge is at most this many pixels.
+                    None keeps the source resolution
+            index_dir: Directory for persisted per-frame score indexes. When set, scores from an
+                    earlier scan of the same video are reused and only the selected frames are
+                    decoded again. None disables the index
+            write_frames: Write selected frames as image files to output_dir. When False the encoded
+                    image bytes are kept on each Frame and nothing is written to disk
+            image_format: Encoding of the selected frames, "jpeg" or "webp"
+            image_quality: Encoder quality (0-100). None uses the OpenCV default
+            encode_workers: Size of the thread pool selected frames are resized, encoded and
+                    written on. OpenCV releases the GIL, so encoding overlaps with decoding
+            dedup_distance: Suppress near-duplicate candidates whose perceptual hashes (dHash) are
+                    within this Hamming distance of a higher-scoring candidate, before the
+                    target_frames cut. None disables suppression
+            selection: How candidates are chosen. "score" keeps the highest scores over the whole
+                    video, "nms" additionally keeps selected frames at least nms_window seconds
+                    apart (temporal non-maximum suppression), and "bucket" splits the video into
+                    equal time buckets and keeps the best bucket_quota frames of each
+            nms_window: Minimum distance in seconds between frames selected with "nms"
+            bucket_quota: Frames kept per time bucket with "bucket"
+            candidate_source: Frames scored as candidates. "sampled" decodes the whole video and
+                    scores one frame every sample interval. "keyframes" reads the container's
+                    keyframe (I-frame) index and decodes only those frames, which encoders place
+                    at scene cuts. Falls back to "sampled" when the index cannot be read or nearly
+                    every frame is a keyframe
+            keyframe_neighbours: With "keyframes", also score up to this many frames following
+                    each keyframe, one sample interval apart, to catch changes within a shot
+            budget: "fixed" selects frames_per_minute frames per minute of video. "adaptive" first
+                    measures the activity of every minute from the score index, scales the budget
+                    by the share of active samples and spreads it over minutes in proportion to
+                    their activity, so static footage takes fewer frames. Replaces selection
+            min_per_minute: Frames every minute gets under the "adaptive" budget, however static
+            metric: Frame difference metric, "absdiff", "histogram", "edges" or "ssim", or a
+                    {metric: weight} dict blending several. All score on a 0-255 scale
+            score_batch_size: Number of sampled frames scored together in one vectorized pass.
+                    Their full-resolution frames are held until the batch is scored
+            decode_ahead: Number of sampled frames a background decoder thread may decode ahead
+                    of scoring, into a preallocated ring buffer of score_batch_size +
+                    decode_ahead frames. 0 decodes and scores in turn on one thread
+            crop: Crop selected frames to the region that matters, detected from the score
+                    thumbnails of the scan. "letterbox" removes black bars, "active" also
+                    removes regions that never change. None keeps whole frames. Not applied
+                    when streaming, as the region is only known once the scan is complete
+            index_reuse_finer: Also select from a score index sampled at a finer interval than
+                    requested, e.g. after a run with a higher frames_per_minute. Saves the scan,
+                    but the scores (and so the selected frames) differ from a fresh scan
+            stream_ahead: Number of selected frames iter_keyframes may extract ahead of its
+                    consumer on a background thread, so decoding continues while the consumer
+                    analyzes a frame. 0 extracts only when the consumer asks for the next frame
+        """
+        if decode_mode not in self.DECODE_MODES:
+            raise ValueError(f"Unknown decode mode: {decode_mode} (expected one of {', '.join(self.DECODE_MODES)})")
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown frame backend: {backend} (expected one of {', '.join(self.BACKENDS)})")
+        if backend == "ffmpeg" and not has_ffmpeg():
+            logger.warning("FFmpeg not found. Falling back to the OpenCV frame backend.")
+            backend = "opencv"
+        if selection not in self.SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown selection strategy: {selection} (expected one of {', '.join(self.SELECTION_STRATEGIES)})")
+        if candidate_source not in self.CANDIDATE_SOURCES:
+            raise ValueError(f"Unknown candidate source: {candidate_source} (expected one of {', '.join(self.CANDIDATE_SOURCES)})")
+        if budget not in self.BUDGET_MODES:
+            raise ValueError(f"Unknown frame budget: {budget} (expected one of {', '.join(self.BUDGET_MODES)})")
+        if crop is not None and crop not in self.CROP_MODES:
+            raise ValueError(f"Unknown crop mode: {crop} (expected one of {', '.join(self.CROP_MODES)})")
+        if image_format not in self.IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {image_format} (expected one of {', '.join(self.IMAGE_FORMATS)})")
         self.video_path = video_path
         self.output_dir = output_dir
         self.model = model
+        self.decode_mode = decode_mode
+        self.score_width = score_width
+        self.workers = max(1, workers)
+        self.backend = backend
+        self.max_edge = max_edge
+        self.score_index = ScoreIndexStore(index_dir, index_reuse_finer) if index_dir else None
+        self.write_frames = write_frames
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.encode_workers = max(1, encode_workers)
+        self.dedup_distance = dedup_distance
+        self.selection = selection
+        self.nms_window = nms_window
+        self.bucket_quota = max(1, bucket_quota)
+        self.candidate_source = candidate_source
+        self.keyframe_neighbours = max(0, keyframe_neighbours)
+        self.budget = budget
+        self.min_per_minute = max(0, min_per_minute)
+        self.metric_weights = metric_weights(metric)
+        self.score_batch_size = max(1, score_batch_size)
+        self.decode_ahead = max(0, decode_ahead)
+        self.crop = crop
+        self.stream_ahead = max(0, stream_ahead)
+        self.crop_box = None
+        self.total_frames = 0
+        self.stats: Dict[str, Any] = {}
+        self.fps = 0.0
+        self.frame_size = (0, 0)
         self.frames: List[Frame] = []
         
     def _calculate_frame_difference(self, frame1: np.ndarray, frame2: np.ndarray) -> float:
-        """Calculate the difference between two frames using absolute difference."""
+        """Calculate the difference between two frames with the configured metric.
+
+        Frames may be BGR images or grayscale score thumbnails; thumbnails are used as-is.
+        """
         if frame1 is None or frame2 is None:
             return 0.0
         
-        # Convert to grayscale for simpler comparison
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-        
-        # Calculate absolute difference and mean
-        diff = cv2.absdiff(gray1, gray2)
-        score = np.mean(diff)
-        
-        return float(score)
+        gray1 = to_score_thumbnail(frame1, self.score_width)
+        gray2 = to_score_thumbnail(frame2, self.score_width)
+        return float(score_batch(gray1[None], gray2, self.metric_weights)[0])
+
+    def _iter_scored(self, frames: Iterator[Tuple[int, np.ndarray]],
+                     activity: Optional[ActivityMap] = None) -> Iterator[Tuple[int, np.ndarray, np.ndarray, float]]:
+        """Score consecutive sampled frames in batches, each against the frame before it.
+
+        Yields (frame_number, frame, thumbnail, score). The first frame is scored 0. Thumbnails
+        are also added to activity when given.
+        """
+        previous = None
+        batch: List[Tuple[int, np.ndarray]] = []
+        exhausted = False
+        while not exhausted:
+            item = next(frames, None)
+            if item is not None:
+                batch.append(item)
+                if len(batch) < self.score_batch_size:
+                    continue
+            else:
+                exhausted = True
+            if not batch:
+                continue
+            thumbnails = np.stack([to_score_thumbnail(frame, self.score_width) for _, frame in batch])
+            scores = score_batch(thumbnails, previous, self.metric_weights)
+            if activity is not None:
+                activity.update(thumbnails, previous)
+            previous = thumbnails[-1]
+            for (frame_number, frame), thumbnail, score in zip(batch, thumbnails, scores.tolist()):
+                yield frame_number, frame, thumbnail, score
+            batch = []
 
     def _is_keyframe(self, current_frame: np.ndarray, prev_frame: np.ndarray, threshold: float = FRAME_DIFFERENCE_THRESHOLD) -> bool:
         """Determine if frame is significantly different from previous frame."""
@@ -47,9 +218,453 @@ class VideoProcessor:
         score = self._calculate_frame_difference(current_frame, prev_frame)
         return score > threshold
 
-    def extract_keyframes(self, frames_per_minute: int = 10, duration: Optional[float] = None, max_frames: Optional[int] = None) -> List[Frame]:
-        """Extract keyframes from video targeting a specific number of frames per minute."""
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+    @staticmethod
+    def _read_frame(cap: cv2.VideoCapture, buffers: Optional[Iterator[np.ndarray]]) -> Tuple[bool, Optional[np.ndarray]]:
+        """Decode the next frame, into the next of buffers when given."""
+        if buffers is None:
+            return cap.read()
+        buffer = next(buffers, None)
+        if buffer is None:
+            return False, None
+        return cap.read(buffer)
+
+    def _iter_sampled_frames(self, cap: cv2.VideoCapture, start: int, end: int, sample_interval: int,
+                             buffers: Optional[Iterator[np.ndarray]] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_number, frame) for every sampled frame in [start, end), decoding only the sampled ones.
+
+        start must be a multiple of sample_interval so samples land on the same frames however
+        the video is split. Sampled frames are decoded into the arrays of buffers when given.
+        """
+        if self.decode_mode == "seek":
+            for frame_count in range(start, end, sample_interval):
+                if frame_count > 0:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+                ret, frame = self._read_frame(cap, buffers)
+                if not ret:
+                    break
+                yield frame_count, frame
+            return
+
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for frame_count in range(start, end):
+            if frame_count % sample_interval == 0:
+                ret, frame = self._read_frame(cap, buffers)
+                if not ret:
+                    break
+                yield frame_count, frame
+            elif self.decode_mode == "grab":
+                # grab() demuxes and advances without the BGR conversion/copy of read()
+                if not cap.grab():
+                    break
+            else:
+                ret, _ = cap.read()
+                if not ret:
+                    break
+
+    def _scaled_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Apply max_edge to a size, rounded to even dimensions."""
+        if not self.max_edge or max(width, height) <= self.max_edge:
+            return width, height
+        scale = self.max_edge / max(width, height)
+        return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+    def _decode_size(self) -> Tuple[int, int]:
+        """Size of the whole frame once max_edge is applied, which the ffmpeg backend decodes at."""
+        return self._scaled_size(*self.frame_size)
+
+    def _output_size(self) -> Tuple[int, int]:
+        """Size selected frames are saved at once cropped and max_edge is applied."""
+        if self.crop_box is None:
+            return self._decode_size()
+        x0, y0, x1, y1 = crop_pixels(self.crop_box, *self.frame_size)
+        return self._scaled_size(x1 - x0, y1 - y0)
+
+    def _resize_for_output(self, frame: np.ndarray) -> np.ndarray:
+        """Crop a frame and apply max_edge, unless the backend already decoded it at the output size."""
+        if self.crop_box is not None:
+            x0, y0, x1, y1 = crop_pixels(self.crop_box, frame.shape[1], frame.shape[0])
+            frame = frame[y0:y1, x0:x1]
+        width, height = self._output_size()
+        if frame.shape[1] == width and frame.shape[0] == height:
+            return frame
+        if width > frame.shape[1] or height > frame.shape[0]:
+            # Never upscale: it only adds pixels the model has to pay for
+            return frame
+        return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+    def _encode_frame(self, frame: np.ndarray) -> bytes:
+        """Encode a frame with the configured image format and quality."""
+        params = []
+        if self.image_quality is not None:
+            flag = cv2.IMWRITE_WEBP_QUALITY if self.image_format == "webp" else cv2.IMWRITE_JPEG_QUALITY
+            params = [flag, int(self.image_quality)]
+        ok, encoded = cv2.imencode(self.IMAGE_FORMATS[self.image_format], frame, params)
+        if not ok:
+            raise ValueError(f"Could not encode frame as {self.image_format}")
+        return encoded.tobytes()
+
+    def _source_payload_size(self, frame_num: int, frame: np.ndarray, payload_size: int) -> int:
+        """Size one frame would have been without cropping and max_edge, so the saving can be reported."""
+        if self._output_size() == self.frame_size:
+            return payload_size
+        if frame.shape[:2] != self.frame_size[::-1]:
+            # The backend decoded at output size; fetch the source-resolution frame once
+            frame = next(self._iter_frames_at([frame_num]))[1]
+            if frame is None:
+                return payload_size
+        return len(self._encode_frame(frame))
+
+    def _iter_segment_frames(self, start: int, end: int, sample_interval: int,
+                             buffers: Optional[Iterator[np.ndarray]] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield the sampled frames in [start, end) from the configured backend."""
+        if self.backend == "ffmpeg":
+            yield from iter_ffmpeg_frames(self.video_path, start, end, sample_interval, self.fps,
+                                          self._decode_size(), self.frame_size, buffers)
+            return
+
+        cap = cv2.VideoCapture(str(self.video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {self.video_path}")
+        try:
+            yield from self._iter_sampled_frames(cap, start, end, sample_interval, buffers)
+        finally:
+            cap.release()
+
+    def _decode_ring(self) -> Optional[FrameRing]:
+        """Ring buffer sampled frames are decoded into on a background thread, if enabled."""
+        if not self.decode_ahead:
+            return None
+        width, height = self._decode_size() if self.backend == "ffmpeg" else self.frame_size
+        # A scoring batch must stay valid until it has been scored and its candidates kept
+        return FrameRing((height, width, 3), self.score_batch_size, self.decode_ahead)
+
+    def _iter_decoded(self, start: int, end: int, sample_interval: int, ring: Optional[FrameRing]) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield the sampled frames in [start, end), through ring when given."""
+        if ring is None:
+            return self._iter_segment_frames(start, end, sample_interval)
+        return ring.frames(lambda buffers: self._iter_segment_frames(start, end, sample_interval, buffers))
+
+    def _record_decode_stats(self, ring_stats: List[Dict[str, float]]) -> None:
+        """Summarize the decode rings of one scan, whose segments may have run in parallel."""
+        if not ring_stats:
+            return
+        decoded_frames = sum(stats["decoded_frames"] for stats in ring_stats)
+        decode_seconds = max(stats["decode_seconds"] for stats in ring_stats)
+        self.stats.update({
+            "decoded_frames": decoded_frames,
+            "decode_fps": round(decoded_frames / decode_seconds, 1) if decode_seconds else 0.0,
+            "decoder_stalls": sum(stats["decoder_stalls"] for stats in ring_stats),
+            "consumer_stalls": sum(stats["consumer_stalls"] for stats in ring_stats)
+        })
+        logger.debug(
+            f"Decoded {decoded_frames} sampled frames at {self.stats['decode_fps']} fps "
+            f"(decoder stalled {self.stats['decoder_stalls']} times, scorer {self.stats['consumer_stalls']} times)"
+        )
+
+    def _iter_frames_at(self, frame_numbers: List[int], ordered: bool = True) -> Iterator[Tuple[int, Optional[np.ndarray]]]:
+        """Seek to and decode only the given frames, in ascending order unless ordered is False.
+
+        Frames that cannot be decoded are yielded as None.
+        """
+        cap = cv2.VideoCapture(str(self.video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {self.video_path}")
+        try:
+            for frame_number in sorted(frame_numbers) if ordered else frame_numbers:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                ret, frame = cap.read()
+                if not ret:
+                    logger.warning(f"Could not decode frame {frame_number}")
+                    frame = None
+                yield frame_number, frame
+        finally:
+            cap.release()
+
+    def _keyframe_numbers(self, total_frames: int) -> Optional[List[int]]:
+        """Keyframes in [0, total_frames) to use as candidates, or None to fall back to sampling."""
+        keyframes = probe_keyframes(self.video_path, self.fps)
+        if keyframes is None:
+            logger.warning("Could not read the keyframe index. Falling back to sampled candidates.")
+            return None
+        keyframes = [frame_num for frame_num in keyframes if frame_num < total_frames]
+        # Intra-only codecs (MJPEG, ProRes, ...) mark every frame as a keyframe, leaving nothing to skip
+        if not keyframes or len(keyframes) * 2 > total_frames:
+            logger.info(f"{len(keyframes)} keyframes in {total_frames} frames. Falling back to sampled candidates.")
+            return None
+        return keyframes
+
+    def _iter_keyframe_candidates(self, keyframes: List[int], total_frames: int, sample_interval: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_number, frame) for each keyframe and its configured neighbours.
+
+        Each keyframe is reached with a seek, which decodes only that frame. Its neighbours are
+        then reached by grabbing forward, never past the next keyframe.
+        """
+        cap = cv2.VideoCapture(str(self.video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {self.video_path}")
+        position = 0
+        try:
+            for i, keyframe in enumerate(keyframes):
+                next_keyframe = keyframes[i + 1] if i + 1 < len(keyframes) else total_frames
+                if position != keyframe:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                    position = keyframe
+                for target in range(keyframe, min(next_keyframe, keyframe + self.keyframe_neighbours * sample_interval + 1), sample_interval):
+                    while position < target and cap.grab():
+                        position += 1
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    position += 1
+                    yield target, frame
+        finally:
+            cap.release()
+
+    def _scan_keyframes(self, keyframes: List[int], total_frames: int, sample_interval: int, target_frames: int) -> Tuple[Candidates, ScoreIndex]:
+        """Decode and score only keyframes (and their neighbours), each against the previous candidate."""
+        candidates = self._new_candidates(target_frames, window=False)
+        frame_numbers, scores = [], []
+        activity = ActivityMap() if self.crop else None
+        keyframe_candidates = self._iter_keyframe_candidates(keyframes, total_frames, sample_interval)
+        for frame_count, frame, thumbnail, score in self._iter_scored(keyframe_candidates, activity):
+            frame_numbers.append(frame_count)
+            scores.append(score)
+            if score > self.FRAME_DIFFERENCE_THRESHOLD:
+                candidates.push(frame_count, frame, score, self._phash(thumbnail))
+        self._record_suppression_stats(candidates)
+        logger.info(f"Scored {len(frame_numbers)} keyframe candidates out of {total_frames} frames")
+
+        numbers = np.asarray(frame_numbers, dtype=np.int64)
+        # Without neighbours the candidates do not depend on the sample interval, so the index
+        # serves any later budget
+        index = ScoreIndex(numbers, numbers / self.fps, np.asarray(scores, dtype=np.float32),
+                           sample_interval if self.keyframe_neighbours else 1, total_frames,
+                           activity.changes if activity else None, activity.brightness if activity else None,
+                           any_interval=not self.keyframe_neighbours)
+        return candidates, index
+
+    def _new_candidates(self, target_frames: int, window: bool = True) -> Candidates:
+        """Create the candidate selection structure for the configured strategy.
+
+        Scans pass window=False: candidates then arrive in time order, which "nms" cannot handle
+        exactly, so the window is applied once the scan is complete.
+        """
+        if self.selection == "bucket":
+            bucket_length = self.total_frames * self.bucket_quota / target_frames
+            return BucketCandidates(bucket_length, self.bucket_quota, self.dedup_distance)
+        min_gap = max(1, round(self.nms_window * self.fps)) if self.selection == "nms" and window else None
+        return TopKCandidates(target_frames, self.dedup_distance, min_gap)
+
+    def _phash(self, frame: np.ndarray) -> Optional[int]:
+        """Perceptual hash of a frame or score thumbnail, when near-duplicate suppression is enabled."""
+        if self.dedup_distance is None:
+            return None
+        return dhash(to_score_thumbnail(frame, self.score_width))
+
+    def _build_frame(self, idx: int, frame_num: int, frame: np.ndarray, score: float) -> Tuple[Frame, int]:
+        """Resize, encode and (if enabled) write one selected frame. Returns the Frame and its payload size."""
+        image = self._encode_frame(self._resize_for_output(frame))
+        timestamp = frame_num / self.fps
+        if self.write_frames:
+            frame_path = self.output_dir / f"frame_{idx}{self.IMAGE_FORMATS[self.image_format]}"
+            frame_path.write_bytes(image)
+            return Frame(idx, frame_path, timestamp, score), len(image)
+        return Frame(idx, None, timestamp, score, image=image), len(image)
+
+    def _scan_segment(self, start: int, end: int, sample_interval: int, target_frames: int) -> SegmentScan:
+        """Decode and score the sampled frames in [start, end).
+
+        The sample just before start is decoded as well so the first frame of a segment is scored
+        against the same previous frame as in a single sequential scan.
+        """
+        # Only the target_frames best candidates (plus one scoring batch) are ever held at full
+        # resolution; scoring compares each sampled frame's thumbnail with the previous one
+        candidates = self._new_candidates(target_frames, window=False)
+        frame_numbers, scores = [], []
+        activity = ActivityMap() if self.crop else None
+
+        scan_start = max(0, start - sample_interval)
+        ring = self._decode_ring()
+        sampled = self._iter_decoded(scan_start, end, sample_interval, ring)
+        for frame_count, frame, thumbnail, score in self._iter_scored(sampled, activity):
+            if frame_count < start:
+                continue
+            frame_numbers.append(frame_count)
+            scores.append(score)
+            if score > self.FRAME_DIFFERENCE_THRESHOLD and candidates.qualifies(frame_count, score):
+                # Ring buffers are reused, so only frames that make the cut are copied out
+                kept = frame.copy() if ring is not None else frame
+                candidates.push(frame_count, kept, score, self._phash(thumbnail))
+
+        return SegmentScan(candidates.ranked(), frame_numbers, scores, candidates.suppressed,
+                           candidates.suppressed_in_window, ring.stats() if ring is not None else {}, activity)
+
+    def _scan(self, total_frames: int, sample_interval: int, target_frames: int) -> Tuple[Candidates, ScoreIndex]:
+        """Decode and score the whole video, in parallel segments if configured.
+
+        With keyframe candidates only the keyframes are decoded, in a single pass. With "nms" the
+        window is applied to the complete scores best first, as when selecting from a score
+        index, so a scan and a later run from its index select the same frames.
+        """
+        candidates, index = self._scan_candidates(total_frames, sample_interval, target_frames)
+        if self.selection == "nms":
+            # Frames the scan kept are reused; frames it dropped are seek-decoded if selected
+            scanned = {frame_num: frame for frame_num, frame, _ in candidates.ranked()}
+            candidates = self._select_from_index(index, target_frames, decoded=scanned)
+        return candidates, index
+
+    def _scan_candidates(self, total_frames: int, sample_interval: int, target_frames: int) -> Tuple[Candidates, ScoreIndex]:
+        """Scan the video and keep the best target_frames candidates, without the "nms" window."""
+        if self.candidate_source == "keyframes":
+            keyframes = self._keyframe_numbers(total_frames)
+            if keyframes is not None:
+                return self._scan_keyframes(keyframes, total_frames, sample_interval, target_frames)
+
+        segments = self._split_segments(total_frames, sample_interval)
+        candidates = self._new_candidates(target_frames, window=False)
+        if len(segments) == 1:
+            results = [self._scan_segment(0, total_frames, sample_interval, target_frames)]
+        else:
+            logger.debug(f"Scanning {len(segments)} segments in parallel: {segments}")
+            with ProcessPoolExecutor(max_workers=len(segments)) as executor:
+                futures = [
+                    executor.submit(self._scan_segment, start, end, sample_interval, target_frames)
+                    for start, end in segments
+                ]
+                results = [future.result() for future in futures]
+
+        # Each segment returns its own top target_frames, so the global top-K is among them
+        frame_numbers, scores = [], []
+        suppressed = suppressed_in_window = 0
+        activity = ActivityMap()
+        for segment in results:
+            for frame_num, frame, score in segment.candidates:
+                candidates.push(frame_num, frame, score, self._phash(frame))
+            frame_numbers.extend(segment.frame_numbers)
+            scores.extend(segment.scores)
+            suppressed += segment.suppressed
+            suppressed_in_window += segment.suppressed_in_window
+            if segment.activity is not None:
+                activity.merge(segment.activity)
+        self._record_decode_stats([segment.ring_stats for segment in results if segment.ring_stats])
+        self.stats["near_duplicates_suppressed"] = candidates.suppressed + suppressed
+        self.stats["frames_suppressed_by_window"] = candidates.suppressed_in_window + suppressed_in_window
+
+        numbers = np.asarray(frame_numbers, dtype=np.int64)
+        index = ScoreIndex(numbers, numbers / self.fps, np.asarray(scores, dtype=np.float32),
+                           sample_interval, total_frames, activity.changes, activity.brightness)
+        return candidates, index
+
+    def _select_from_index(self, index: ScoreIndex, target_frames: int, candidates: Optional[Candidates] = None,
+                           threshold: float = FRAME_DIFFERENCE_THRESHOLD,
+                           decoded: Optional[Dict[int, np.ndarray]] = None) -> Candidates:
+        """Rank candidates from a score index without a full decode.
+
+        Candidates are offered in descending score order, which makes "nms" selection exact.
+        Without near-duplicate suppression only scores are needed and frames are decoded later.
+        With it, candidates are seek-decoded in rank order, skipping near-duplicates, until
+        target_frames distinct frames are found.
+
+        Args:
+            index: Scores of the sampled frames
+            target_frames: Number of frames to select
+            candidates: Selection structure to fill. None creates one for the configured strategy
+            threshold: Only samples scoring above this are candidates
+            decoded: Frames already decoded by a scan, by frame number, used instead of decoding
+                    them again
+        """
+        if candidates is None:
+            candidates = self._new_candidates(target_frames)
+        decoded = decoded or {}
+        ranked = [
+            (frame_num, score)
+            for frame_num, score in zip(index.frame_numbers.tolist(), index.scores.tolist())
+            if score > threshold
+        ]
+        ranked.sort(key=lambda x: (-x[1], x[0]))
+        if self.dedup_distance is None:
+            for frame_num, score in ranked:
+                candidates.push(frame_num, decoded.get(frame_num), score)
+            self._record_suppression_stats(candidates)
+            return candidates
+
+        # Seek-decoded in rank order, so they line up with the ranked candidates not yet decoded
+        seeked = self._iter_frames_at([frame_num for frame_num, _ in ranked if frame_num not in decoded],
+                                      ordered=False)
+        try:
+            for frame_num, score in ranked:
+                frame = decoded.get(frame_num)
+                if frame is None:
+                    _, frame = next(seeked)
+                if frame is not None:
+                    candidates.push(frame_num, frame, score, self._phash(frame))
+                if len(candidates) >= target_frames:
+                    break
+        finally:
+            seeked.close()
+        self._record_suppression_stats(candidates)
+        return candidates
+
+    def _select_adaptive(self, index: ScoreIndex, target_frames: int, frames_per_minute: int) -> Candidates:
+        """Select frames under a budget spread over each minute of video in proportion to its activity.
+
+        A minute's activity is its number of samples scoring above the difference threshold. The
+        budget is target_frames scaled by the share of active samples, with at least
+        min_per_minute frames per minute; a static minute still gets its floor from its
+        highest-scoring samples.
+        """
+        bucket_length = 60 * self.fps
+        num_buckets = max(1, int(np.ceil(self.total_frames / bucket_length)))
+        buckets = (index.frame_numbers // bucket_length).astype(np.int64)
+        capacity = np.bincount(buckets, minlength=num_buckets)
+        active = np.bincount(buckets, weights=index.scores > self.FRAME_DIFFERENCE_THRESHOLD, minlength=num_buckets)
+
+        budget = round(target_frames * active.sum() / max(1, capacity.sum()))
+        floor = min(self.min_per_minute, frames_per_minute)
+        quotas = allocate_budget(active, budget, floor, capacity)
+        self.stats["frame_budget"] = sum(quotas)
+        logger.info(
+            f"Adaptive frame budget: {sum(quotas)} frames over {num_buckets} minutes "
+            f"({int(active.sum())} of {int(capacity.sum())} samples active, fixed rate would select {target_frames})"
+        )
+        logger.debug(f"Frames per minute: {quotas}")
+
+        candidates = BucketCandidates(bucket_length, dedup_distance=self.dedup_distance, quotas=quotas)
+        # Floors are filled from below-threshold samples too, so every minute is covered
+        return self._select_from_index(index, sum(quotas), candidates, threshold=-1.0)
+
+    def _record_suppression_stats(self, candidates: Candidates) -> None:
+        self.stats["near_duplicates_suppressed"] = candidates.suppressed
+        self.stats["frames_suppressed_by_window"] = candidates.suppressed_in_window
+
+    def _score_params_key(self) -> str:
+        """Identify the scoring settings a persisted score index depends on."""
+        key = f"w{self.score_width or 'full'}"
+        if self.metric_weights != {"absdiff": 1.0}:
+            key += "_" + "-".join(f"{name}{weight:g}" for name, weight in sorted(self.metric_weights.items()))
+        if self.candidate_source == "keyframes":
+            key += f"_kf{self.keyframe_neighbours}"
+        if self.backend == "ffmpeg":
+            # ffmpeg scores frames that were already scaled to max_edge
+            key += f"_ff{self.max_edge or 'full'}"
+        return key
+
+    def _split_segments(self, total_frames: int, sample_interval: int) -> List[Tuple[int, int]]:
+        """Split [0, total_frames) into contiguous ranges that start on sampled frames."""
+        num_samples = -(-total_frames // sample_interval)
+        num_segments = max(1, min(self.workers, num_samples))
+        bounds = [round(i * num_samples / num_segments) * sample_interval for i in range(num_segments)]
+        bounds.append(total_frames)
+        return [(bounds[i], bounds[i + 1]) for i in range(num_segments)]
+
+    def _prepare_sampling(self, frames_per_minute: int, duration: Optional[float], max_frames: Optional[int]) -> Tuple[int, int, int]:
+        """Read the video properties and work out how many frames to select and how often to sample.
+
+        Returns (total_frames, target_frames, sample_interval).
+        """
+        if self.write_frames:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
         
         cap = cv2.VideoCapture(str(self.video_path))
         if not cap.isOpened():
@@ -57,6 +672,9 @@ class VideoProcessor:
         
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = fps
+        self.frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        cap.release()
         video_duration = total_frames / fps
         
         if duration:
@@ -72,45 +690,179 @@ class VideoProcessor:
         
         # Calculate adaptive sampling interval
         sample_interval = max(1, total_frames // (target_frames * 2))
-        
-        frame_candidates = []
-        prev_frame = None
-        frame_count = 0
-        
-        while frame_count < total_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            if frame_count % sample_interval == 0:
-                score = self._calculate_frame_difference(frame, prev_frame)
-                if score > self.FRAME_DIFFERENCE_THRESHOLD:
-                    frame_candidates.append((frame_count, frame, score))
-                prev_frame = frame.copy()
-                
-            frame_count += 1
-            
-        cap.release()
-        
-        # Select the most significant frames by score, then restore chronological order
-        selected_candidates = sorted(frame_candidates, key=lambda x: x[2], reverse=True)[:target_frames]
+        self.total_frames = total_frames
+        return total_frames, target_frames, sample_interval
+
+    def _set_crop(self, index: ScoreIndex) -> None:
+        """Crop selected frames to the region the scan found worth keeping."""
+        self.crop_box = ActivityMap(index.changes, index.brightness).crop_box(self.crop)
+        if self.crop_box is None:
+            logger.info("No region to crop found, keeping whole frames")
+            return
+        x0, y0, x1, y1 = crop_pixels(self.crop_box, *self.frame_size)
+        self.stats["crop"] = {"left": x0, "top": y0, "width": x1 - x0, "height": y1 - y0}
+        logger.info(f"Cropping frames to {x1 - x0}x{y1 - y0} at ({x0}, {y0}) of {self.frame_size[0]}x{self.frame_size[1]}")
+
+    def _record_payload_stats(self, payload_bytes: int, source_bytes: int) -> None:
+        output_width, output_height = self._output_size()
+        self.stats.update({
+            "source_resolution": f"{self.frame_size[0]}x{self.frame_size[1]}",
+            "frame_resolution": f"{output_width}x{output_height}",
+            "frame_payload_bytes": payload_bytes,
+            "source_payload_bytes_estimate": source_bytes * len(self.frames) if self.frames else 0
+        })
+        if self.frames:
+            logger.info(
+                f"Frame payload: {payload_bytes / len(self.frames) / 1024:.0f} KB/frame at "
+                f"{self.stats['frame_resolution']} {self.image_format} "
+                f"(~{source_bytes / 1024:.0f} KB/frame at source {self.stats['source_resolution']})"
+            )
+
+    def iter_keyframes(self, frames_per_minute: int = 10, duration: Optional[float] = None, max_frames: Optional[int] = None) -> Iterator[Frame]:
+        """Stream keyframes while the video is still being decoded.
+
+        The video is divided into target_frames equal time buckets and the highest-scoring
+        candidate of each bucket is yielded as soon as the scan moves past it, so frames can be
+        analyzed while decoding continues. With stream_ahead the scan runs on a background
+        thread and keeps going while the consumer works on a frame. Unlike extract_keyframes,
+        selection is per bucket rather than global, which also spreads frames evenly over the
+        video. Frames are numbered and yielded in chronological order; self.frames holds them all
+        once the iterator is exhausted.
+        """
+        ignored = [
+            name for name, is_set in (
+                ("selection", self.selection != "score"),
+                ("budget", self.budget != "fixed"),
+                ("candidate_source", self.candidate_source != "sampled"),
+                ("crop", bool(self.crop)),
+                ("workers", self.workers > 1)
+            ) if is_set
+        ]
+        if ignored:
+            logger.warning(f"Streaming selects one frame per time bucket and ignores: {', '.join(ignored)}")
+        frames = self._stream_keyframes(frames_per_minute, duration, max_frames)
+        if self.stream_ahead:
+            return read_ahead(frames, self.stream_ahead, name="keyframe-stream")
+        return frames
+
+    def _stream_keyframes(self, frames_per_minute: int, duration: Optional[float],
+                          max_frames: Optional[int]) -> Iterator[Frame]:
+        """Scan the video and yield each time bucket's keyframe once the scan moves past it."""
+        total_frames, target_frames, sample_interval = self._prepare_sampling(frames_per_minute, duration, max_frames)
+        buckets = BucketSelector(total_frames / target_frames)
+        self.frames = []
+        payload_bytes = 0
+        source_bytes = 0
+        released_hashes: List[int] = []
+        self.stats["near_duplicates_suppressed"] = 0
+
+        def release(finished: List[Candidate]) -> Iterator[Frame]:
+            nonlocal payload_bytes, source_bytes
+            for frame_num, frame, score in finished:
+                phash = self._phash(frame)
+                if phash is not None:
+                    # Bucket winners can only be compared with frames already released
+                    if any(hamming_distance(phash, other) <= self.dedup_distance for other in released_hashes):
+                        self.stats["near_duplicates_suppressed"] += 1
+                        continue
+                    released_hashes.append(phash)
+                frame_obj, size = self._build_frame(len(self.frames), frame_num, frame, score)
+                if not self.frames:
+                    source_bytes = self._source_payload_size(frame_num, frame, size)
+                payload_bytes += size
+                self.frames.append(frame_obj)
+                yield frame_obj
+
+        ring = self._decode_ring()
+        sampled = self._iter_decoded(0, total_frames, sample_interval, ring)
+        for frame_count, frame, _, score in self._iter_scored(sampled):
+            yield from release(buckets.advance(frame_count))
+            if score > self.FRAME_DIFFERENCE_THRESHOLD and buckets.qualifies(frame_count, score):
+                # Ring buffers are reused, so only frames that lead their bucket are copied out
+                buckets.push(frame_count, frame.copy() if ring is not None else frame, score)
+        yield from release(buckets.flush())
+        if ring is not None:
+            self._record_decode_stats([ring.stats()])
+
+        self._record_payload_stats(payload_bytes, source_bytes)
+        logger.info(f"Streamed {len(self.frames)} frames from video (target was {target_frames})")
+
+    def extract_keyframes(self, frames_per_minute: int = 10, duration: Optional[float] = None, max_frames: Optional[int] = None) -> List[Frame]:
+        """Extract keyframes from video targeting a specific number of frames per minute."""
+        total_frames, target_frames, sample_interval = self._prepare_sampling(frames_per_minute, duration, max_frames)
+
+        index = None
+        if self.score_index:
+            content_hash = video_content_hash(self.video_path)
+            index = self.score_index.load(content_hash, self._score_params_key(), sample_interval, total_frames)
+
+        if index is not None and self.crop and index.changes is None:
+            logger.info("Score index has no activity map for cropping. Rescanning.")
+            index = None
+
+        # Frames already decoded by a scan, so a second selection pass need not decode them again
+        scanned_frames: Dict[int, np.ndarray] = {}
+        if index is not None:
+            # Scores are already known: rank them without decoding, frames are fetched below
+            logger.info(f"Selecting frames from score index ({len(index.scores)} sampled frames)")
+            if self.budget == "fixed":
+                candidates = self._select_from_index(index, target_frames)
+        else:
+            candidates, index = self._scan(total_frames, sample_interval, target_frames)
+            if self.score_index:
+                self.score_index.save(content_hash, self._score_params_key(), index)
+            scanned_frames = {frame_num: frame for frame_num, frame, _ in candidates.ranked()}
+
+        self.stats["sampled_frames"] = len(index.scores)
+        if self.crop:
+            self._set_crop(index)
+        if self.budget == "adaptive":
+            # Second pass: the scan only measured activity, the budget is spread from its scores
+            candidates = self._select_adaptive(index, target_frames, frames_per_minute)
+
+        if self.stats["near_duplicates_suppressed"]:
+            logger.info(f"Suppressed {self.stats['near_duplicates_suppressed']} near-duplicate frames")
+
+        # Candidates come back most significant first
+        selected_candidates = [
+            (frame_num, frame if frame is not None else scanned_frames.get(frame_num), score)
+            for frame_num, frame, score in candidates.ranked()
+        ]
+        if self.crop_box is not None and self.backend == "ffmpeg" and self._decode_size() != self.frame_size:
+            # The scan decoded whole frames at max_edge, which leaves too few pixels once cropped:
+            # fetch the selected frames again at source resolution
+            selected_candidates = [(frame_num, None, score) for frame_num, _, score in selected_candidates]
 
         # If max_frames is specified, sample evenly across the candidates
-        if max_frames is not None and max_frames < len(selected_candidates):
-            step = len(selected_candidates) / max_frames
-            selected_frames = [selected_candidates[int(i * step)] for i in range(max_frames)]
+        if max_frames is not None:
+            selected_frames = sample_evenly(selected_candidates, max_frames)
         else:
             selected_frames = selected_candidates
 
         # Re-sort by frame number so frames on disk and in the JSON are chronological
         selected_frames = sorted(selected_frames, key=lambda x: x[0])
 
-        self.frames = []
-        for idx, (frame_num, frame, score) in enumerate(selected_frames):
-            frame_path = self.output_dir / f"frame_{idx}.jpg"
-            cv2.imwrite(str(frame_path), frame)
-            timestamp = frame_num / fps
-            self.frames.append(Frame(idx, frame_path, timestamp, score))
+        # Frames selected from a score index are seek-decoded here. Resizing, encoding and
+        # writing run on a thread pool, overlapping with that decode
+        decoded = self._iter_frames_at([frame_num for frame_num, frame, _ in selected_frames if frame is None])
+        jobs = []
+        first_frame = None
+        with ThreadPoolExecutor(max_workers=self.encode_workers) as executor:
+            for frame_num, frame, score in selected_frames:
+                if frame is None:
+                    # Both lists are in ascending frame order
+                    _, frame = next(decoded)
+                    if frame is None:
+                        continue
+                if first_frame is None:
+                    first_frame = (frame_num, frame)
+                jobs.append(executor.submit(self._build_frame, len(jobs), frame_num, frame, score))
+            results = [job.result() for job in jobs]
+
+        self.frames = [frame for frame, _ in results]
+        payload_bytes = sum(size for _, size in results)
+        source_bytes = self._source_payload_size(*first_frame, results[0][1]) if results else 0
+        self._record_payload_stats(payload_bytes, source_bytes)
         
         logger.info(f"Extracted {len(self.frames)} frames from video (target was {target_frames})")
         return self.frames
@@ -0,0 +1,92 @@
+import math
+from typing import Optional, Tuple
+import numpy as np
+
+# Gray levels a thumbnail pixel must change by between samples to count as activity
+CHANGE_THRESHOLD = 12
+# Pixels never brighter than this are treated as black bars
+BLACK_LEVEL = 24
+# Share of a thumbnail row or column that must be active for the line to be kept
+LINE_FRACTION = 0.02
+# Margin added around the detected region, as a share of the frame size
+CROP_MARGIN = 0.02
+# A crop must remove at least this share of the frame area to be applied
+MIN_CROP_SAVING = 0.1
+# Crops are never narrower or shorter than this share of the frame
+MIN_CROP_EXTENT = 0.25
+
+# Fractional (left, top, right, bottom) of a frame
+CropBox = Tuple[float, float, float, float]
+
+class ActivityMap:
+    """Where in the frame anything changes or is visible, accumulated from score thumbnails.
+
+    changes counts, per thumbnail pixel, the sample pairs in which it changed by more than
+    CHANGE_THRESHOLD; brightness is the brightest value it took.
+    """
+
+    def __init__(self, changes: Optional[np.ndarray] = None, brightness: Optional[np.ndarray] = None):
+        self.changes = changes
+        self.brightness = brightness
+
+    def update(self, thumbnails: np.ndarray, previous: Optional[np.ndarray]) -> None:
+        """Add a (N, H, W) batch of consecutive thumbnails, previous being the one sampled before it."""
+        first = thumbnails[:1] if previous is None else previous[None]
+        previous_batch = np.concatenate([first, thumbnails[:-1]])
+        changed = (np.abs(thumbnails.astype(np.int16) - previous_batch) > CHANGE_THRESHOLD).sum(axis=0, dtype=np.uint32)
+        brightest = thumbnails.max(axis=0)
+        if self.changes is None:
+            self.changes, self.brightness = changed, brightest
+        else:
+            self.changes += changed
+            np.maximum(self.brightness, brightest, out=self.brightness)
+
+    def merge(self, other: "ActivityMap") -> None:
+        """Add the activity of another part of the same video."""
+        if other.changes is None:
+            return
+        if self.changes is None:
+            self.changes, self.brightness = other.changes.copy(), other.brightness.copy()
+        else:
+            self.changes += other.changes
+            np.maximum(self.brightness, other.brightness, out=self.brightness)
+
+    def crop_box(self, mode: str) -> Optional[CropBox]:
+        """Region of the frame worth keeping, or None to keep the whole frame.
+
+        Args:
+            mode: "letterbox" removes black bars only. "active" also removes regions that never
+                  change, such as the static chrome around a screen recording
+        """
+        if self.changes is None:
+            return None
+        mask = self.brightness > BLACK_LEVEL
+        if mode == "active" and (mask & (self.changes > 0)).any():
+            mask &= self.changes > 0
+        rows = np.flatnonzero(mask.mean(axis=1) > LINE_FRACTION)
+        cols = np.flatnonzero(mask.mean(axis=0) > LINE_FRACTION)
+        if not rows.size or not cols.size:
+            return None
+
+        height, width = mask.shape
+        top, bottom = _expand(rows[0] / height, (rows[-1] + 1) / height)
+        left, right = _expand(cols[0] / width, (cols[-1] + 1) / width)
+        if (right - left) * (bottom - top) > 1 - MIN_CROP_SAVING:
+            return None
+        return left, top, right, bottom
+
+def _expand(start: float, end: float) -> Tuple[float, float]:
+    """Add the crop margin and widen to the minimum extent, staying within the frame."""
+    start, end = max(0.0, start - CROP_MARGIN), min(1.0, end + CROP_MARGIN)
+    if end - start < MIN_CROP_EXTENT:
+        center = (start + end) / 2
+        start = min(max(0.0, center - MIN_CROP_EXTENT / 2), 1.0 - MIN_CROP_EXTENT)
+        end = start + MIN_CROP_EXTENT
+    return start, end
+
+def crop_pixels(box: CropBox, width: int, height: int) -> Tuple[int, int, int, int]:
+    """Pixel (left, top, right, bottom) of a crop box on a width x height frame, at even coordinates."""
+    left, top, right, bottom = box
+    x0, y0 = int(left * width) // 2 * 2, int(top * height) // 2 * 2
+    x1, y1 = min(width, math.ceil(right * width / 2) * 2), min(height, math.ceil(bottom * height / 2) * 2)
+    return x0, y0, x1, y1
@@ -0,0 +1,154 @@
+from collections import deque
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, Tuple, TypeVar
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Decodes frames into the buffers it is handed and yields (frame_number, frame). It must stop
+# when next(buffers, None) returns None
+FrameSource = Callable[[Iterator[np.ndarray]], Iterator[Tuple[int, np.ndarray]]]
+
+T = TypeVar("T")
+
+class FrameRing:
+    """Preallocated ring of frame buffers filled by a decoder thread and drained by a consumer.
+
+    The decoder writes each frame straight into a free buffer, so sampled frames are neither
+    allocated nor copied one by one. OpenCV and FFmpeg pipe reads release the GIL, so decoding
+    overlaps with scoring in the consuming thread.
+
+    A yielded frame stays valid until hold further frames have been requested; a consumer that
+    keeps a frame longer must copy it. Up to ahead frames are decoded before they are needed.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], hold: int, ahead: int):
+        self.hold = max(1, hold)
+        self._buffers = np.empty((self.hold + max(1, ahead),) + tuple(shape), dtype=np.uint8)
+        self.decoded_frames = 0
+        self.decode_seconds = 0.0
+        # Times the decoder found every buffer in use (scoring is the bottleneck)
+        self.decoder_stalls = 0
+        # Times the consumer found no decoded frame waiting (decoding is the bottleneck)
+        self.consumer_stalls = 0
+
+    def frames(self, source: FrameSource) -> Iterator[Tuple[int, np.ndarray]]:
+        """Run source on a decoder thread and yield its frames in order."""
+        free: "queue.Queue" = queue.Queue()
+        for slot in range(len(self._buffers)):
+            free.put(slot)
+        filled: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        handed_out = [0]
+
+        def buffers() -> Iterator[np.ndarray]:
+            while not stop.is_set():
+                try:
+                    slot = free.get_nowait()
+                except queue.Empty:
+                    self.decoder_stalls += 1
+                    slot = free.get()
+                if slot is None:
+                    return
+                handed_out[0] = slot
+                yield self._buffers[slot]
+
+        def decode() -> None:
+            start = time.perf_counter()
+            decoded = source(buffers())
+            try:
+                for frame_number, frame in decoded:
+                    # The source decodes one frame per buffer, so this frame is in the last one handed out
+                    filled.put((frame_number, frame, handed_out[0]))
+                    self.decoded_frames += 1
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                filled.put(e)
+            finally:
+                decoded.close()
+                self.decode_seconds += time.perf_counter() - start
+                filled.put(None)
+
+        thread = threading.Thread(target=decode, name="frame-decoder", daemon=True)
+        thread.start()
+        held: deque = deque()
+        try:
+            while True:
+                if len(held) >= self.hold:
+                    free.put(held.popleft())
+                try:
+                    item = filled.get_nowait()
+                except queue.Empty:
+                    self.consumer_stalls += 1
+                    item = filled.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                frame_number, frame, slot = item
+                held.append(slot)
+                yield frame_number, frame
+        finally:
+            stop.set()
+            free.put(None)  # Wake the decoder if it is waiting for a buffer
+            thread.join()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "decoded_frames": self.decoded_frames,
+            "decode_seconds": self.decode_seconds,
+            "decoder_stalls": self.decoder_stalls,
+            "consumer_stalls": self.consumer_stalls
+        }
+
+def read_ahead(items: Iterator[T], size: int, name: str = "read-ahead") -> Iterator[T]:
+    """Run an iterator on a background thread and yield its items, keeping up to size ready.
+
+    The iterator keeps running while the consumer works on the items already handed out, until
+    size items are waiting. Closing the returned iterator stops and closes the source on its
+    thread; an exception raised by the source is raised in the consumer.
+    """
+    ready: "queue.Queue" = queue.Queue(maxsize=max(1, size))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    break
+        except Exception as e:
+            put((done, e))
+        else:
+            put((done, None))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = ready.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,133 @@
+from typing import Callable, Dict, Optional, Union
+import cv2
+import numpy as np
+
+# Gray levels per histogram bin for the "histogram" metric (32 bins)
+HISTOGRAM_BIN_WIDTH = 8
+# Gradient magnitude above which a thumbnail pixel counts as an edge for the "edges" metric
+EDGE_THRESHOLD = 32
+# Side of the square windows SSIM statistics are computed over
+SSIM_BLOCK = 8
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def to_score_thumbnail(frame: np.ndarray, width: Optional[int] = None) -> np.ndarray:
+    """Convert a BGR frame to the grayscale image used for difference scoring.
+
+    When width is set and smaller than the frame, the frame is downscaled to that width first so
+    that scoring cost does not depend on the source resolution.
+    """
+    if width and frame.shape[1] > width:
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        # Resize before the color conversion so cvtColor only touches the small image
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+def dhash(thumbnail: np.ndarray, hash_size: int = 8) -> int:
+    """Compute the difference hash of a grayscale image as a hash_size * hash_size bit integer.
+
+    Each bit records whether a pixel is brighter than its right-hand neighbour in a
+    (hash_size + 1) x hash_size downscale, so near-identical frames get hashes a small
+    Hamming distance apart.
+    """
+    small = cv2.resize(thumbnail, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return bin(hash1 ^ hash2).count("1")
+
+# Every metric below scores a (N, H, W) uint8 batch of thumbnails against the batch of the frames
+# before them and returns N scores on a 0-255 scale, so one difference threshold serves them all
+
+def _absdiff(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Mean absolute gray-level difference."""
+    return np.abs(current.astype(np.int16) - previous).mean(axis=(1, 2))
+
+def _histograms(batch: np.ndarray) -> np.ndarray:
+    num_bins = 256 // HISTOGRAM_BIN_WIDTH
+    flat = batch.reshape(len(batch), -1) // HISTOGRAM_BIN_WIDTH
+    # Offset each frame's bins so a single bincount builds every histogram
+    flat = flat.astype(np.int64) + np.arange(len(batch))[:, None] * num_bins
+    counts = np.bincount(flat.ravel(), minlength=len(batch) * num_bins)
+    return counts.reshape(len(batch), num_bins) / flat.shape[1]
+
+def _histogram(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Total variation distance between gray-level histograms. Ignores motion, catches cuts and fades."""
+    return 0.5 * np.abs(_histograms(current) - _histograms(previous)).sum(axis=1) * 255
+
+def _edge_maps(batch: np.ndarray) -> np.ndarray:
+    batch = batch.astype(np.int16)
+    gradient = np.abs(np.diff(batch, axis=2))[:, :-1, :] + np.abs(np.diff(batch, axis=1))[:, :, :-1]
+    return gradient > EDGE_THRESHOLD
+
+def _dilate(edges: np.ndarray) -> np.ndarray:
+    """3x3 binary dilation of a batch of edge maps."""
+    height, width = edges.shape[1:]
+    padded = np.pad(edges, ((0, 0), (1, 1), (1, 1)))
+    dilated = np.zeros_like(edges)
+    for dy in range(3):
+        for dx in range(3):
+            dilated |= padded[:, dy:dy + height, dx:dx + width]
+    return dilated
+
+def _edges(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Edge change ratio: the larger share of edges entering or leaving, tolerating 1 pixel of motion."""
+    current_edges, previous_edges = _edge_maps(current), _edge_maps(previous)
+    entering = (current_edges & ~_dilate(previous_edges)).sum(axis=(1, 2))
+    exiting = (previous_edges & ~_dilate(current_edges)).sum(axis=(1, 2))
+    entering = entering / np.maximum(current_edges.sum(axis=(1, 2)), 1)
+    exiting = exiting / np.maximum(previous_edges.sum(axis=(1, 2)), 1)
+    return np.maximum(entering, exiting) * 255
+
+def _blocks(batch: np.ndarray, block: int) -> np.ndarray:
+    num, height, width = batch.shape
+    rows, cols = height // block, width // block
+    cropped = batch[:, :rows * block, :cols * block].astype(np.float32)
+    return cropped.reshape(num, rows, block, cols, block)
+
+def _ssim(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Structural dissimilarity, 1 - SSIM over non-overlapping windows."""
+    block = max(1, min(SSIM_BLOCK, *current.shape[1:]))
+    x, y = _blocks(current, block), _blocks(previous, block)
+    mean_x, mean_y = x.mean(axis=(2, 4)), y.mean(axis=(2, 4))
+    var_x, var_y = x.var(axis=(2, 4)), y.var(axis=(2, 4))
+    covariance = ((x - mean_x[:, :, None, :, None]) * (y - mean_y[:, :, None, :, None])).mean(axis=(2, 4))
+    ssim = ((2 * mean_x * mean_y + SSIM_C1) * (2 * covariance + SSIM_C2)) / \
+           ((mean_x ** 2 + mean_y ** 2 + SSIM_C1) * (var_x + var_y + SSIM_C2))
+    return np.clip(1 - ssim.mean(axis=(1, 2)), 0, 1) * 255
+
+METRICS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "absdiff": _absdiff,
+    "histogram": _histogram,
+    "edges": _edges,
+    "ssim": _ssim,
+}
+
+def metric_weights(metric: Union[str, Dict[str, float]]) -> Dict[str, float]:
+    """Normalize a metric name or a {metric: weight} blend to weights that sum to 1."""
+    weights = {metric: 1.0} if isinstance(metric, str) else dict(metric)
+    unknown = [name for name in weights if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown frame metric: {', '.join(unknown)} (expected one of {', '.join(METRICS)})")
+    total = sum(weights.values())
+    if total <= 0 or any(weight < 0 for weight in weights.values()):
+        raise ValueError(f"Frame metric weights must be non-negative and not all zero: {weights}")
+    return {name: weight / total for name, weight in weights.items() if weight > 0}
+
+def score_batch(thumbnails: np.ndarray, previous: Optional[np.ndarray], weights: Dict[str, float]) -> np.ndarray:
+    """Score a (N, H, W) batch of grayscale thumbnails, each against the one before it.
+
+    Args:
+        thumbnails: Consecutive sampled thumbnails, all the same size
+        previous: Thumbnail sampled just before the batch. None scores the first thumbnail 0
+        weights: Normalized metric weights, see metric_weights
+    """
+    first = thumbnails[:1] if previous is None else previous[None]
+    previous_batch = np.concatenate([first, thumbnails[:-1]])
+    scores = np.zeros(len(thumbnails), dtype=np.float64)
+    for name, weight in weights.items():
+        scores += weight * METRICS[name](thumbnails, previous_batch)
+    return scores
@@ -0,0 +1,221 @@
+import heapq
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from .frame_scoring import hamming_distance
+
+# A candidate frame: (frame_number, frame_data, score)
+Candidate = Tuple[int, Any, float]
+
+class TopKCandidates:
+    """Bounded min-heap keeping the k highest-scoring candidate frames.
+
+    Only k frames are ever held in memory, however long the video is. Ties are broken in
+    favour of the earlier frame, matching a stable sort of all candidates by descending score.
+
+    With dedup_distance set, candidates carrying a perceptual hash within that Hamming distance
+    of a kept candidate are treated as near-duplicates and only the higher-scoring one is kept.
+    suppressed counts the near-duplicates that would otherwise have held a top-k slot.
+
+    With min_gap set, candidates less than min_gap frames apart conflict in the same way, which
+    gives temporal non-maximum suppression. Pushing candidates in descending score order yields
+    exact greedy NMS; in any other order a candidate suppressed early cannot come back if its
+    suppressor is later replaced, which drops good frames along chains of overlapping windows.
+    Scans therefore collect candidates without min_gap and apply it best first at the end.
+    """
+
+    def __init__(self, k: int, dedup_distance: Optional[int] = None, min_gap: Optional[int] = None):
+        self.k = max(0, k)
+        self.dedup_distance = dedup_distance
+        self.min_gap = min_gap
+        self.suppressed = 0
+        self.suppressed_in_window = 0
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._hashes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _qualifies(self, entry: Tuple[float, int, Any]) -> bool:
+        return len(self._heap) < self.k or entry[:2] > self._heap[0][:2]
+
+    def _is_duplicate(self, kept: Tuple[float, int, Any], phash: Optional[int]) -> bool:
+        if self.dedup_distance is None or phash is None or -kept[1] not in self._hashes:
+            return False
+        return hamming_distance(phash, self._hashes[-kept[1]]) <= self.dedup_distance
+
+    def _in_window(self, kept: Tuple[float, int, Any], frame_number: int) -> bool:
+        return self.min_gap is not None and abs(-kept[1] - frame_number) < self.min_gap
+
+    def qualifies(self, frame_number: int, score: float) -> bool:
+        """Whether a candidate would currently make the top k, ignoring near-duplicate and window conflicts."""
+        return self.k > 0 and self._qualifies((score, -frame_number))
+
+    def push(self, frame_number: int, frame: Any, score: float, phash: Optional[int] = None) -> bool:
+        """Offer a candidate. Returns True if it is currently among the top k."""
+        if self.k == 0:
+            return False
+        # Negated frame number makes the later frame the smaller entry on equal scores
+        entry = (score, -frame_number, frame)
+        if not self._qualifies(entry):
+            return False
+
+        if self.dedup_distance is not None or self.min_gap is not None:
+            duplicates = [kept for kept in self._heap if self._is_duplicate(kept, phash)]
+            neighbours = [kept for kept in self._heap if self._in_window(kept, frame_number)]
+            if any(kept[:2] > entry[:2] for kept in duplicates + neighbours):
+                if duplicates:
+                    self.suppressed += 1
+                else:
+                    self.suppressed_in_window += 1
+                return False
+            # The new candidate beats every conflicting candidate already kept
+            duplicate_numbers = {kept[1] for kept in duplicates}
+            removed = duplicate_numbers | {kept[1] for kept in neighbours}
+            self.suppressed += len(duplicate_numbers)
+            self.suppressed_in_window += len(removed) - len(duplicate_numbers)
+            if removed:
+                self._heap = [kept for kept in self._heap if kept[1] not in removed]
+                heapq.heapify(self._heap)
+                for neg_number in removed:
+                    self._hashes.pop(-neg_number, None)
+            if phash is not None:
+                self._hashes[frame_number] = phash
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            evicted = heapq.heapreplace(self._heap, entry)
+            self._hashes.pop(-evicted[1], None)
+        return True
+
+    def extend(self, candidates: Iterable[Candidate]) -> None:
+        for frame_number, frame, score in candidates:
+            self.push(frame_number, frame, score)
+
+    def ranked(self) -> List[Candidate]:
+        """Return the kept candidates ordered by descending score."""
+        entries = sorted(self._heap, key=lambda entry: (-entry[0], -entry[1]))
+        return [(-neg_number, frame, score) for score, neg_number, frame in entries]
+
+def sample_evenly(candidates: List[Candidate], count: int) -> List[Candidate]:
+    """Pick count candidates spread evenly across the list."""
+    if count >= len(candidates):
+        return list(candidates)
+    step = len(candidates) / count
+    return [candidates[int(i * step)] for i in range(count)]
+
+class BucketSelector:
+    """Keep the best candidates of each fixed-length bucket of frames.
+
+    Buckets are closed as soon as the scan moves past them, so their winners can be released while
+    the scan is still running. Frames must be offered in frame order.
+    """
+
+    def __init__(self, bucket_length: float, quota: int = 1):
+        self.bucket_length = max(1.0, bucket_length)
+        self.quota = quota
+        self._bucket = None
+        self._candidates = TopKCandidates(quota)
+
+    def advance(self, frame_number: int) -> List[Candidate]:
+        """Tell the selector the scan has reached frame_number. Returns the winners of a closed bucket."""
+        bucket = int(frame_number // self.bucket_length)
+        finished = []
+        if self._bucket is not None and bucket != self._bucket:
+            finished = self.flush()
+        self._bucket = bucket
+        return finished
+
+    def qualifies(self, frame_number: int, score: float) -> bool:
+        """Whether a candidate would currently win a place in its bucket. Call after advance."""
+        return self._candidates.qualifies(frame_number, score)
+
+    def push(self, frame_number: int, frame: Any, score: float) -> List[Candidate]:
+        """Offer a candidate. Returns the chronological winners of any bucket it closed."""
+        finished = self.advance(frame_number)
+        self._candidates.push(frame_number, frame, score)
+        return finished
+
+    def flush(self) -> List[Candidate]:
+        """Close the current bucket and return its winners in chronological order."""
+        finished = sorted(self._candidates.ranked(), key=lambda x: x[0])
+        self._candidates = TopKCandidates(self.quota)
+        return finished
+
+class BucketCandidates:
+    """Per-time-bucket quota selection: the best quota candidates of every bucket of frames.
+
+    Offers the same push/ranked interface as TopKCandidates and, unlike BucketSelector, accepts
+    candidates in any order, so results from parallel segments can be merged into it. quotas
+    optionally gives each bucket its own quota; buckets past its end get none.
+    """
+
+    def __init__(self, bucket_length: float, quota: int = 1, dedup_distance: Optional[int] = None,
+                 quotas: Optional[Sequence[int]] = None):
+        self.bucket_length = max(1.0, bucket_length)
+        self.quota = quota
+        self.quotas = quotas
+        self.dedup_distance = dedup_distance
+        self.suppressed_in_window = 0
+        self._buckets: Dict[int, TopKCandidates] = {}
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    @property
+    def suppressed(self) -> int:
+        return sum(bucket.suppressed for bucket in self._buckets.values())
+
+    def _bucket(self, frame_number: int) -> TopKCandidates:
+        bucket = int(frame_number // self.bucket_length)
+        if bucket not in self._buckets:
+            quota = self.quota
+            if self.quotas is not None:
+                quota = self.quotas[bucket] if bucket < len(self.quotas) else 0
+            self._buckets[bucket] = TopKCandidates(quota, self.dedup_distance)
+        return self._buckets[bucket]
+
+    def qualifies(self, frame_number: int, score: float) -> bool:
+        return self._bucket(frame_number).qualifies(frame_number, score)
+
+    def push(self, frame_number: int, frame: Any, score: float, phash: Optional[int] = None) -> bool:
+        return self._bucket(frame_number).push(frame_number, frame, score, phash)
+
+    def ranked(self) -> List[Candidate]:
+        candidates = [candidate for bucket in self._buckets.values() for candidate in bucket.ranked()]
+        return sorted(candidates, key=lambda x: (-x[2], x[0]))
+
+def allocate_budget(activity: Sequence[float], budget: int, floor: int, capacity: Sequence[int]) -> List[int]:
+    """Split a frame budget across segments in proportion to their activity.
+
+    Every segment first gets floor frames, then the rest of budget is shared out in proportion
+    to activity using largest remainders. No segment gets more than its capacity.
+
+    Args:
+        activity: Non-negative activity measure of each segment
+        budget: Total number of frames to allocate
+        floor: Minimum frames per segment, which may take the total above budget
+        capacity: Maximum frames per segment (its number of candidate frames)
+    """
+    capacity = np.asarray(capacity, dtype=np.int64)
+    quotas = np.minimum(floor, capacity)
+    weights = np.asarray(activity, dtype=np.float64) * (quotas < capacity)
+    remaining = budget - int(quotas.sum())
+    # Repeat while capped segments leave budget over for the others
+    while remaining > 0 and weights.sum() > 0:
+        shares = remaining * weights / weights.sum()
+        extra = np.floor(shares).astype(np.int64)
+        leftover = remaining - int(extra.sum())
+        if leftover:
+            remainders = np.where(weights > 0, shares - extra, -1.0)
+            extra[np.argsort(-remainders, kind="stable")[:leftover]] += 1
+        extra = np.minimum(extra, capacity - quotas)
+        if not extra.any():
+            break
+        quotas += extra
+        remaining -= int(extra.sum())
+        weights = weights * (quotas < capacity)
+    return quotas.tolist()
+
+# Either candidate selection structure used by VideoProcessor
+Candidates = Union[TopKCandidates, BucketCandidates]
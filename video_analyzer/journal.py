@@ -0,0 +1,174 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from .audio_processor import AudioTranscript
+from .frame import Frame
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class JournalState:
+    """Everything a previous run of the same video recorded before it stopped."""
+    video: str
+    model: str
+    settings: Dict[str, str] = field(default_factory=dict)  # Fingerprints of the settings each stage used
+    transcript_recorded: bool = False
+    transcript: Optional[AudioTranscript] = None
+    frames: Optional[List[Frame]] = None  # None until the frame list was recorded
+    analyses: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # By frame number
+    analysis_timestamps: Dict[int, float] = field(default_factory=dict)
+    # Rolling context summaries, by the number of leading frame analyses they fold in
+    summaries: Dict[int, str] = field(default_factory=dict)
+
+    def analysis_for(self, frame: Frame) -> Optional[Dict[str, Any]]:
+        """Recorded analysis of a frame, if it was recorded for a frame at the same time."""
+        timestamp = self.analysis_timestamps.get(frame.number)
+        if timestamp is None or abs(timestamp - frame.timestamp) > 1e-3:
+            return None
+        return self.analyses[frame.number]
+
+    def drop_analyses(self) -> None:
+        """Forget the recorded analyses, so every frame is analyzed again."""
+        self.analyses.clear()
+        self.analysis_timestamps.clear()
+        self.summaries.clear()
+
+class Journal:
+    """Append-only JSONL record of a run's completed work, so it can be resumed after a crash.
+
+    Each line is one record: the run it belongs to, the transcript, the frame list and every
+    frame analysis as it completes. Lines are flushed to disk as they are written; a line cut
+    short by a crash is ignored on load.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    def load(self) -> Optional[JournalState]:
+        """Read the recorded state, or None if there is no journal."""
+        if not self.path.exists():
+            return None
+        state = None
+        with open(self.path) as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring incomplete line {line_number} of {self.path}")
+                    continue
+                kind = record.get("type")
+                if kind == "run":
+                    state = JournalState(record["video"], record["model"], record.get("settings", {}))
+                elif state is None:
+                    continue
+                elif kind == "transcript":
+                    state.transcript_recorded = True
+                    state.transcript = (
+                        AudioTranscript(record["text"], record["segments"], record["language"])
+                        if record.get("text") is not None else None
+                    )
+                elif kind == "frames":
+                    state.frames = [
+                        Frame(f["number"], Path(f["path"]) if f["path"] else None, f["timestamp"], f["score"])
+                        for f in record["frames"]
+                    ]
+                elif kind == "analysis":
+                    state.analyses[record["frame"]] = record["analysis"]
+                    state.analysis_timestamps[record["frame"]] = record["timestamp"]
+                elif kind == "summary":
+                    state.summaries[record["frames"]] = record["summary"]
+        return state
+
+    def start(self, video_path: Path, model: str, settings: Optional[Dict[str, str]] = None,
+              carry_over: Optional[JournalState] = None) -> None:
+        """Start a new journal for a run, discarding any previous one.
+
+        Args:
+            video_path: Video the run analyzes
+            model: Vision model of the run
+            settings: Fingerprints of the settings each stage uses, compared when resuming
+            carry_over: Results of a previous run to record in the new journal first
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The new journal is written next to the old one and replaces it once complete, so a crash
+        # while carrying results over leaves the old journal intact
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(temp_path, "w")
+        try:
+            self._append({"type": "run", "video": str(video_path), "model": model, "settings": settings or {}})
+            if carry_over is not None:
+                if carry_over.transcript_recorded:
+                    self.record_transcript(carry_over.transcript)
+                if carry_over.frames is not None:
+                    self.record_frames(carry_over.frames)
+                for number, analysis in carry_over.analyses.items():
+                    self._write({"type": "analysis", "frame": number,
+                                 "timestamp": carry_over.analysis_timestamps[number], "analysis": analysis})
+                for frames, summary in carry_over.summaries.items():
+                    self._write({"type": "summary", "frames": frames, "summary": summary})
+            self._sync()
+        except BaseException:
+            self.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+        os.replace(temp_path, self.path)
+
+    def reopen(self) -> None:
+        """Continue the existing journal of a resumed run."""
+        cut_short = False
+        with open(self.path, "rb") as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                cut_short = f.read(1) != b"\n"
+        self._file = open(self.path, "a")
+        if cut_short:
+            # End the line a crash cut short so it does not swallow the next record
+            self._file.write("\n")
+
+    def record_transcript(self, transcript: Optional[AudioTranscript]) -> None:
+        self._append({
+            "type": "transcript",
+            "text": transcript.text if transcript else None,
+            "segments": transcript.segments if transcript else None,
+            "language": transcript.language if transcript else None
+        })
+
+    def record_frames(self, frames: List[Frame]) -> None:
+        """Record the extracted frames. Frames kept only in memory are recorded without a path."""
+        self._append({
+            "type": "frames",
+            "frames": [
+                {"number": f.number, "path": str(f.path) if f.path else None, "timestamp": f.timestamp, "score": f.score}
+                for f in frames
+            ]
+        })
+
+    def record_analysis(self, frame: Frame, analysis: Dict[str, Any]) -> None:
+        """Record a completed frame analysis. Failed analyses are not recorded, so a resumed run retries them."""
+        if analysis.get("error"):
+            return
+        self._append({"type": "analysis", "frame": frame.number, "timestamp": frame.timestamp, "analysis": analysis})
+
+    def record_summary(self, summarized_frames: int, summary: str) -> None:
+        """Record the rolling context summary of the first summarized_frames frame analyses."""
+        self._append({"type": "summary", "frames": summarized_frames, "summary": summary})
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._write(record)
+        self._sync()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record) + "\n")
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from each sampled position of the video when fingerprinting it
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+# File name suffix of indexes that serve a scan at any sample interval
+ANY_INTERVAL = "any"
+
+@dataclass
+class ScoreIndex:
+    """Difference score of every sampled frame of a video.
+
+    frame_numbers, timestamps and scores are parallel arrays in chronological order covering
+    frames [0, scanned_frames) sampled every sample_interval frames. An any_interval index was
+    scored on frames that do not depend on the sample interval (e.g. only keyframes) and serves a
+    scan at any interval. changes and brightness are the ActivityMap of the whole scan, when one
+    was recorded.
+    """
+    frame_numbers: np.ndarray
+    timestamps: np.ndarray
+    scores: np.ndarray
+    sample_interval: int
+    scanned_frames: int
+    changes: Optional[np.ndarray] = None
+    brightness: Optional[np.ndarray] = None
+    any_interval: bool = False
+
+    def truncate(self, total_frames: int) -> "ScoreIndex":
+        """Return the part of the index covering frames [0, total_frames).
+
+        The activity map cannot be split by frame and is kept whole.
+        """
+        keep = self.frame_numbers < total_frames
+        return ScoreIndex(self.frame_numbers[keep], self.timestamps[keep], self.scores[keep],
+                          self.sample_interval, min(self.scanned_frames, total_frames),
+                          self.changes, self.brightness, self.any_interval)
+
+def video_content_hash(video_path: Path) -> str:
+    """Fingerprint a video by its size and the bytes at its start, middle and end.
+
+    Reading three fixed-size chunks keeps hashing time constant for multi-gigabyte files while
+    still changing whenever the file is re-encoded, trimmed or replaced.
+    """
+    size = video_path.stat().st_size
+    digest = hashlib.sha256(str(size).encode())
+    with open(video_path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_CHUNK_SIZE // 2), max(0, size - HASH_CHUNK_SIZE)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_CHUNK_SIZE))
+    return digest.hexdigest()[:32]
+
+class ScoreIndexStore:
+    """Sidecar .npz files of ScoreIndex, keyed by video content hash and scoring parameters."""
+
+    def __init__(self, index_dir: Path, reuse_finer: bool = False):
+        """Initialize the store.
+
+        Args:
+            index_dir: Directory the .npz files are kept in
+            reuse_finer: Also serve scans from indexes sampled at a finer interval. Scores between
+                    adjacent fine samples differ from scores at the requested interval, so the
+                    selected frames can differ from a fresh scan
+        """
+        self.index_dir = Path(index_dir)
+        self.reuse_finer = reuse_finer
+
+    def _path(self, content_hash: str, params_key: str, index: ScoreIndex) -> Path:
+        interval = ANY_INTERVAL if index.any_interval else index.sample_interval
+        return self.index_dir / f"{content_hash}_{params_key}_{interval}.npz"
+
+    def load(self, content_hash: str, params_key: str, sample_interval: int, total_frames: int) -> Optional[ScoreIndex]:
+        """Load an index that can serve a scan of total_frames at sample_interval.
+
+        Indexes sampled at the same interval qualify, as do any_interval indexes, or with
+        reuse_finer also finer ones, as long as they cover all total_frames. The coarsest
+        qualifying index is used as it is closest to the requested one.
+        """
+        if not self.index_dir.exists():
+            return None
+        usable = []
+        for path in self.index_dir.glob(f"{content_hash}_{params_key}_*.npz"):
+            suffix = path.stem.rsplit("_", 1)[1]
+            if suffix == ANY_INTERVAL:
+                usable.append((sample_interval, path))
+                continue
+            try:
+                interval = int(suffix)
+            except ValueError:
+                continue
+            if interval == sample_interval or (self.reuse_finer and interval < sample_interval):
+                usable.append((interval, path))
+
+        for interval, path in sorted(usable, reverse=True):
+            try:
+                with np.load(path) as data:
+                    index = ScoreIndex(
+                        frame_numbers=data["frame_numbers"],
+                        timestamps=data["timestamps"],
+                        scores=data["scores"],
+                        sample_interval=int(data["sample_interval"]),
+                        scanned_frames=int(data["scanned_frames"]),
+                        changes=data["changes"] if "changes" in data.files else None,
+                        brightness=data["brightness"] if "brightness" in data.files else None,
+                        any_interval=bool(data["any_interval"]) if "any_interval" in data.files else False
+                    )
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable score index {path}: {e}")
+                continue
+            if index.scanned_frames >= total_frames:
+                logger.debug(f"Using score index {path}")
+                return index.truncate(total_frames)
+        return None
+
+    def save(self, content_hash: str, params_key: str, index: ScoreIndex) -> Path:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(content_hash, params_key, index)
+        activity = {}
+        if index.changes is not None:
+            activity = {"changes": index.changes, "brightness": index.brightness}
+        np.savez(
+            path,
+            frame_numbers=index.frame_numbers.astype(np.int64),
+            timestamps=index.timestamps.astype(np.float64),
+            scores=index.scores.astype(np.float32),
+            sample_interval=index.sample_interval,
+            scanned_frames=index.scanned_frames,
+            any_interval=index.any_interval,
+            **activity
+        )
+        logger.debug(f"Saved score index for {len(index.scores)} sampled frames to {path}")
+        return path